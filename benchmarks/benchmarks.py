@@ -0,0 +1,250 @@
+"""Benchmarks of the descriptors for airspeed velocity (asv)
+
+Every benchmark is run for each of `SHAPES`, synthetic two phase
+microstructures from 32^2 to 2048^2 and 16^3 to 128^3 and the
+samples of `notebooks/data/cahn-hilliard.zip`, and, where it has a
+graph, for both the networkx (`graph_descriptors`) and graph-tool
+(`graph_graphtool`) backends. The `time_*` benchmarks record the time
+and the `peakmem_*` benchmarks the peak memory. To run them with the
+current environment, from the root of the repository,
+
+    $ asv run --python=same
+
+The results are stored as JSON in `.asv/results`, and two runs are
+compared with
+
+    $ asv compare <commit> <commit>
+
+The combinations that cannot be run are skipped: the skeletal
+descriptors are only defined for 2D microstructures, networkx has no
+boundary distances, the networkx graphs of the largest
+microstructures take minutes and gigabytes to build, and the graph-tool
+benchmarks need graph-tool installed.
+"""
+
+import os
+from itertools import islice
+
+import numpy as np
+from scipy import ndimage
+
+from pygraspi import graph_descriptors
+from pygraspi.combined_descriptors import make_descriptors
+from pygraspi.datasets import iter_zip
+from pygraspi.descriptor_plan import descriptor_names
+from pygraspi.makeGridGraph import make_grid_edges
+from pygraspi.skeletal_descriptors import getSkeletalDescriptors
+
+CAHN_HILLIARD = os.path.join(
+    os.path.dirname(__file__), os.pardir, "notebooks", "data", "cahn-hilliard.zip"
+)
+
+## The number of Cahn-Hilliard samples in the end to end benchmarks
+N_CAHN_HILLIARD = 8
+
+SHAPES = [
+    "32x32",
+    "128x128",
+    "512x512",
+    "2048x2048",
+    "16x16x16",
+    "32x32x32",
+    "64x64x64",
+    "128x128x128",
+    "cahn-hilliard",
+]
+
+BACKENDS = ["networkx", "graph-tool"]
+
+## The largest number of pixels for the networkx backend
+NETWORKX_MAX_SIZE = 2**16
+
+
+def make_samples(name):
+    """The microstructures for one of `SHAPES`, (n_sample, n_x, n_y, ...)
+
+    The synthetic microstructures are smoothed random noise cut at its
+    median, so that both phases percolate as in the Cahn-Hilliard
+    samples.
+    """
+    if name == "cahn-hilliard":
+        return np.array(list(islice(iter_zip(CAHN_HILLIARD), N_CAHN_HILLIARD)))
+    shape = tuple(int(x) for x in name.split("x"))
+    noise = ndimage.gaussian_filter(np.random.default_rng(0).random(shape), 2)
+    return (noise > np.median(noise)).astype(int)[None]
+
+
+def graphtool():
+    """`pygraspi.graph_graphtool`, imported on first use so that the
+    other benchmarks run without graph-tool"""
+    try:
+        # pylint: disable=import-outside-toplevel
+        from pygraspi import graph_graphtool
+    except ImportError as error:
+        raise NotImplementedError(f"graph-tool is not available ({error})") from error
+    return graph_graphtool
+
+
+def check_backend(sample, backend):
+    """Skip the networkx backend for the largest microstructures, and
+    the graph-tool backend without graph-tool"""
+    if backend == "networkx" and sample.size > NETWORKX_MAX_SIZE:
+        raise NotImplementedError("too large for networkx")
+    if backend == "graph-tool":
+        graphtool()
+
+
+def check_2d(sample):
+    """Skip the skeletal descriptors for volumes"""
+    if sample.ndim != 2:
+        raise NotImplementedError("only 2D skeletons")
+
+
+def make_image_graph(sample, backend):
+    """The graph of a microstructure with the interface vertex"""
+    if backend == "networkx":
+        return graph_descriptors.makeInterfaceEdges(
+            graph_descriptors.makeImageGraph(sample)
+        )
+    return graphtool().makeImageGraph_gt(sample)
+
+
+def graspi_descriptors(samples, backend):
+    """All the descriptors of the samples that are defined for them"""
+    if backend != "networkx":
+        names = None if samples.ndim == 3 else descriptor_names(samples.shape[1:])
+        return make_descriptors(samples, descriptors=names, backend=backend)
+    return [
+        {
+            **(getSkeletalDescriptors(x) if x.ndim == 2 else {}),
+            **graph_descriptors.getGraspiDescriptors(x),
+        }
+        for x in samples
+    ]
+
+
+class GridEdges:
+    """The edges of the grid graph shared by the backends"""
+
+    params = [SHAPES]
+    param_names = ["shape"]
+    timeout = 600
+
+    def setup(self, name):
+        self.shape = make_samples(name)[0].shape
+
+    def time_make_grid_edges(self, _):
+        make_grid_edges(*self.shape)
+
+    def peakmem_make_grid_edges(self, _):
+        make_grid_edges(*self.shape)
+
+
+class ImageGraph:
+    """The graph of a microstructure, `makeImageGraph_gt` for graph-tool"""
+
+    params = [SHAPES, BACKENDS]
+    param_names = ["shape", "backend"]
+    timeout = 600
+
+    def setup(self, name, backend):
+        self.sample = make_samples(name)[0]
+        check_backend(self.sample, backend)
+
+    def time_make_image_graph(self, _, backend):
+        make_image_graph(self.sample, backend)
+
+    def peakmem_make_image_graph(self, _, backend):
+        make_image_graph(self.sample, backend)
+
+
+class InterfaceDistance:
+    """The distances to the interface, `shortest_distance_gt` for
+    graph-tool"""
+
+    params = [SHAPES, BACKENDS]
+    param_names = ["shape", "backend"]
+    timeout = 600
+
+    def setup(self, name, backend):
+        sample = make_samples(name)[0]
+        check_backend(sample, backend)
+        self.graph = make_image_graph(sample, backend)
+
+    def time_shortest_distance(self, _, backend):
+        if backend == "networkx":
+            graph_descriptors.shortest_distances_all(self.graph)
+        else:
+            graphtool().shortest_distance_gt(self.graph)
+
+    def peakmem_shortest_distance(self, name, backend):
+        self.time_shortest_distance(name, backend)
+
+
+class BoundaryDistance:
+    """The distances to the boundaries, `surface_shortest_distances`,
+    on the graph with boundary vertices from `apply_grid_template`"""
+
+    params = [SHAPES, ["graph-tool"]]
+    param_names = ["shape", "backend"]
+    timeout = 600
+
+    def setup(self, name, backend):
+        sample = make_samples(name)[0]
+        check_backend(sample, backend)
+        self.shape = sample.shape
+        self.graph = graphtool().apply_grid_template(
+            graphtool().grid_template(sample.shape), sample
+        )[1]
+
+    def time_surface_shortest_distances(self, *_):
+        graphtool().surface_shortest_distances(self.graph, self.shape)
+
+    def peakmem_surface_shortest_distances(self, *_):
+        graphtool().surface_shortest_distances(self.graph, self.shape)
+
+
+class SkeletalDescriptors:
+    """The descriptors of the skeletons of both phases"""
+
+    params = [SHAPES]
+    param_names = ["shape"]
+    timeout = 600
+
+    def setup(self, name):
+        self.sample = make_samples(name)[0]
+        check_2d(self.sample)
+
+    def time_skeletal_descriptors(self, _):
+        getSkeletalDescriptors(self.sample)
+
+    def peakmem_skeletal_descriptors(self, _):
+        getSkeletalDescriptors(self.sample)
+
+
+class Descriptors:
+    """All the descriptors end to end, `make_descriptors` for
+    graph-tool and the sparse backend, with `N_CAHN_HILLIARD`
+    Cahn-Hilliard samples"""
+
+    params = [SHAPES, BACKENDS + ["sparse"]]
+    param_names = ["shape", "backend"]
+    timeout = 1800
+
+    def setup(self, name, backend):
+        self.samples = make_samples(name)
+        check_backend(self.samples[0], backend)
+
+    def time_descriptors(self, _, backend):
+        graspi_descriptors(self.samples, backend)
+
+    def peakmem_descriptors(self, _, backend):
+        graspi_descriptors(self.samples, backend)
+
+
+class Import:
+    """The import of the public API in a new process, as made by each
+    worker of `make_descriptors`"""
+
+    def timeraw_import_combined_descriptors(self):
+        return "import pygraspi.combined_descriptors"
@@ -0,0 +1,6 @@
+"""The modules that need graph-tool are not collected without it, so
+the doctests of the other backends run on their own."""
+
+from importlib.util import find_spec
+
+collect_ignore = [] if find_spec("graph_tool") else ["pygraspi/graph_graphtool.py"]
@@ -3,6 +3,7 @@
 , pytestCheckHook
 , pytest
 , numpy
+, scipy
 , networkx
 , scikitimage
 , sknw
@@ -19,6 +20,7 @@ buildPythonPackage rec {
 
   propagatedBuildInputs = [
     numpy
+    scipy
     networkx
     scikitimage
     sknw
@@ -0,0 +1,182 @@
+"""Caches the descriptors of each sample on disk, keyed by the content
+of the sample, so that the samples already seen are not calculated
+again, across sessions and datasets.
+"""
+
+import functools
+import hashlib
+import json
+import os
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from .makeGridGraph import periodic_axes
+
+## The version of the descriptor calculations, part of every key, to
+## be increased whenever the value of a descriptor changes
+DESCRIPTOR_VERSION = 1
+
+
+def sample_key(sample, descriptors=None, kind="descriptors", periodic=False):
+    """The cache key of the descriptors of a sample
+
+    The key is a hash of the bytes, type and shape of the sample, the
+    requested descriptors, `DESCRIPTOR_VERSION`, the `kind` of
+    result, such as the function that calculates it, and the periodic
+    axes.
+
+    Args:
+      sample: the microstructure
+      descriptors: the names of the descriptors, `None` for all
+      kind: the kind of result
+      periodic: whether the sample wraps around each axis, as in
+        `periodic_axes`
+
+    >>> data = np.array([[0, 1], [0, 1]])
+    >>> key = sample_key(data)
+    >>> len(key)
+    40
+    >>> assert key == sample_key(data.copy())
+    >>> assert key != sample_key(data.T)
+    >>> assert key != sample_key(data.astype(np.uint8))
+    >>> assert key != sample_key(data, ["phase_0_cc"])
+    >>> assert sample_key(data, ["a", "b"]) == sample_key(data, ["b", "a"])
+    >>> assert key != sample_key(np.zeros((3, 3)), periodic=True)
+    """
+    sample = np.ascontiguousarray(sample)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(
+        json.dumps(
+            [
+                kind,
+                DESCRIPTOR_VERSION,
+                sample.dtype.str,
+                sample.shape,
+                None if descriptors is None else sorted(set(descriptors)),
+                periodic_axes(periodic, sample.shape),
+            ]
+        ).encode()
+    )
+    digest.update(sample.data)
+    return digest.hexdigest()
+
+
+class DescriptorCache:
+    """
+    A directory of the descriptors of samples, one JSON file each.
+
+    The least recently used entries are removed when the files take
+    more than `max_bytes`. The hits and misses of `get` are counted
+    in `counts`. Only one process should write to a cache at a time,
+    `make_descriptors` reads and writes it from the calling process.
+
+    Args:
+      path: the directory, created if needed
+      max_bytes: the largest size of the entries
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     cache = DescriptorCache(tmp, max_bytes=100)
+    ...     cache.put("a", {"phase_0_cc": 1, "distance": 0.5})
+    ...     cache.put("b", {"phase_0_cc": 2, "distance": 1.5})
+    ...     cache.get("a")
+    ...     cache.put("c", {"phase_0_cc": 3, "distance": 2.5})
+    ...     cache.get("b"), len(cache)
+    {'phase_0_cc': 1, 'distance': 0.5}
+    (None, 2)
+    >>> cache.counts
+    Counter({'hits': 1, 'misses': 1})
+    """
+
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.counts = Counter()
+        os.makedirs(path, exist_ok=True)
+        ## The sizes of the entries from the least to the most recently
+        ## used, which is kept across sessions as the modification times
+        entries = sorted(
+            (x.stat().st_mtime, x.name[: -len(".json")], x.stat().st_size)
+            for x in os.scandir(path)
+            if x.name.endswith(".json")
+        )
+        self._sizes = OrderedDict((x[1], x[2]) for x in entries)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def get(self, key):
+        """The stored row of a key, `None` when there is none"""
+        try:
+            with open(self._file(key), encoding="utf-8") as stream:
+                row = json.load(stream)
+        except FileNotFoundError:
+            self._sizes.pop(key, None)
+            self.counts["misses"] += 1
+            return None
+        os.utime(self._file(key))
+        self._sizes[key] = os.path.getsize(self._file(key))
+        self._sizes.move_to_end(key)
+        self.counts["hits"] += 1
+        return row
+
+    def put(self, key, row):
+        """Store the row of descriptors of a key"""
+        temporary = self._file(key) + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as stream:
+            json.dump(row, stream, default=lambda x: x.item())
+        os.replace(temporary, self._file(key))
+        self._sizes[key] = os.path.getsize(self._file(key))
+        self._sizes.move_to_end(key)
+        total = sum(self._sizes.values())
+        while total > self.max_bytes:
+            oldest, size = self._sizes.popitem(last=False)
+            os.remove(self._file(oldest))
+            total -= size
+
+    def clear(self):
+        """Remove every entry"""
+        for key in list(self._sizes):
+            os.remove(self._file(key))
+        self._sizes.clear()
+
+
+def cached(func, cache):
+    """A descriptor function that reuses the results stored in a cache
+
+    The results are stored by the name of the function, so that the
+    `getGraspiDescriptors` of every backend share the same entries,
+    as they give the same descriptors.
+
+    Args:
+      func: a function such as `getSkeletalDescriptors`, called with
+        a sample and the `descriptors` to calculate
+      cache: a `DescriptorCache`
+
+    >>> import tempfile
+    >>> from pygraspi.graph_sparse import getGraspiDescriptors
+    >>> data = np.array([[0, 0, 0], [1, 1, 1], [0, 0, 0]])
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     cache = DescriptorCache(tmp)
+    ...     describe = cached(getGraspiDescriptors, cache)
+    ...     assert describe(data) == describe(data) == getGraspiDescriptors(data)
+    >>> cache.counts
+    Counter({'misses': 1, 'hits': 1})
+    """
+
+    @functools.wraps(func)
+    def wrapper(sample, descriptors=None, **kwargs):
+        key = sample_key(
+            sample, descriptors, func.__name__, kwargs.get("periodic", False)
+        )
+        row = cache.get(key)
+        if row is None:
+            row = func(sample, descriptors=descriptors, **kwargs)
+            cache.put(key, row)
+        return row
+
+    return wrapper
@@ -0,0 +1,340 @@
+"""The `pygraspi` command, which writes the descriptors of a collection
+of microstructures to a CSV table.
+
+The collection is a directory of sample files, a zip archive such as
+`notebooks/data/cahn-hilliard.zip` or a binary stack from `pack_zip`.
+The next batches of samples are read and parsed on a background thread
+while the current batch is calculated. The ids of the samples written
+are kept in a checkpoint file next to the table, so that a run that is
+interrupted resumes with the samples it had not finished when it is
+started again with the same arguments.
+
+    $ pygraspi notebooks/data/cahn-hilliard.zip descriptors.csv \\
+        --workers 8 --backend sparse
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+from toolz.curried import partition_all
+
+from .combined_descriptors import GRASPI_BACKENDS, make_descriptors
+from .datasets import iter_samples
+
+
+def prefetch(items, size=1):
+    """Iterate over items that are generated ahead on a background thread
+
+    At most `size` items are generated before they are used, so the
+    memory use stays bounded. An error while generating the items is
+    raised where the next item is used.
+
+    Args:
+      items: an iterable, such as a generator that reads samples
+      size: the number of items to generate ahead
+
+    Returns:
+      a generator of the items
+
+    >>> list(prefetch(range(5), size=2))
+    [0, 1, 2, 3, 4]
+    >>> next(prefetch(1 / x for x in [0]))
+    Traceback (most recent call last):
+    ...
+    ZeroDivisionError: division by zero
+    """
+    pending = queue.Queue(size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                pending.put((True, item))
+                if stop.is_set():
+                    return
+        except Exception as error:  # pylint: disable=broad-except
+            pending.put((False, error))
+        else:
+            pending.put((False, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            found, item = pending.get()
+            if not found:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                pending.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def read_checkpoint(path, repair=False):
+    """The ids of the samples in a checkpoint and the size of the table
+    when they were written, an empty set and 0 without a checkpoint
+
+    The entries from the first incomplete line on, such as the last one
+    of a run interrupted while writing it, are left out. With `repair`
+    they are also removed from the checkpoint, so that the entries
+    appended to it next are read.
+    """
+    done, size, end = set(), 0, 0
+    if os.path.exists(path):
+        with open(path, "rb") as stream:
+            for line in stream:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                done.update(entry["ids"])
+                size = entry["size"]
+                end += len(line)
+        if repair:
+            os.truncate(path, end)
+    return done, size
+
+
+def describe_collection(  # pylint: disable=too-many-arguments,too-many-locals
+    source,
+    output,
+    workers=1,
+    descriptors=None,
+    backend="graph-tool",
+    *,
+    batch_size=100,
+    pattern="data_*.txt",
+    checkpoint=None,
+    prefetch_batches=1,
+    log=None,
+):
+    """Write the descriptors of a collection of samples to a CSV table
+
+    Each batch is appended to the table, and then its ids and the size
+    of the table are appended to the checkpoint. The samples in the
+    checkpoint are skipped, and the rows written after the last
+    checkpointed batch, which were interrupted, are removed. Without a
+    checkpoint the table is started again, and an entry of the
+    checkpoint that was interrupted is removed. The samples whose
+    descriptors fail are warned about by id and left out of both, so a
+    run that is started again tries them again. All the samples of a
+    batch must have the same shape.
+
+    Args:
+      source: a directory, zip archive or stack, as in `iter_samples`
+      output: the CSV table, indexed by the id of each sample
+      workers: the number of worker processes
+      descriptors: the columns to calculate, as in `make_descriptors`
+      backend: the backend of the graph descriptors, as in
+        `make_descriptors`
+      batch_size: the number of samples in each batch
+      pattern: the names of the sample files, as in `iter_samples`
+      checkpoint: the checkpoint file, `<output>.checkpoint` by
+        default
+      prefetch_batches: the number of batches to read ahead
+      log: a stream for the progress, none by default
+
+    Returns:
+      the number of samples written by this call
+
+    >>> import tempfile
+    >>> import pandas
+    >>> from pygraspi.datasets import parse_name
+    >>> source = "notebooks/data/cahn-hilliard.zip"
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     output = os.path.join(tmp, "descriptors.csv")
+    ...     describe_collection(
+    ...         source,
+    ...         output,
+    ...         descriptors=["phase_0_cc", "phase_1_cc"],
+    ...         backend="sparse",
+    ...         batch_size=2,
+    ...         pattern="data_0.514_2.4_0001[04]*.txt",
+    ...     )
+    ...     with open(output, "a", encoding="utf-8") as stream:
+    ...         _ = stream.write("cahn-hilliard/interrupted,")
+    ...     describe_collection(
+    ...         source,
+    ...         output,
+    ...         descriptors=["phase_0_cc", "phase_1_cc"],
+    ...         backend="sparse",
+    ...         batch_size=2,
+    ...         pattern="data_0.514_2.4_0001*.txt",
+    ...     )
+    ...     frame = pandas.read_csv(output, index_col=0)
+    2
+    2
+    >>> [parse_name(x)["step"] for x in frame.index]
+    [100, 140, 160, 180]
+    >>> frame.columns.tolist()
+    ['phase_0_cc', 'phase_1_cc']
+
+    A sample that fails, here with a single phase, is not written or
+    checkpointed, and the other samples are.
+
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     np.savetxt(os.path.join(tmp, "data_a.txt"), np.zeros((4, 5)), fmt="%d")
+    ...     np.savetxt(os.path.join(tmp, "data_b.txt"), np.eye(4, 5), fmt="%d")
+    ...     output = os.path.join(tmp, "descriptors.csv")
+    ...     with warnings.catch_warnings(record=True) as caught:
+    ...         warnings.simplefilter("always")
+    ...         describe_collection(tmp, output, backend="sparse", batch_size=1)
+    ...     frame = pandas.read_csv(output, index_col=0)
+    ...     done, _ = read_checkpoint(output + ".checkpoint")
+    1
+    >>> frame.index.tolist(), sorted(done)
+    (['data_b.txt'], ['data_b.txt'])
+    >>> str(caught[0].message)
+    "descriptors failed for data_a.txt: ZeroDivisionError('float division by zero')"
+
+    A run interrupted while writing the checkpoint is resumed from its
+    last complete entry, and so is every run after it.
+
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     for k in range(3):
+    ...         path = os.path.join(tmp, f"data_{k}.txt")
+    ...         np.savetxt(path, np.eye(4, 5, k), fmt="%d")
+    ...     output = os.path.join(tmp, "descriptors.csv")
+    ...     describe_collection(tmp, output, backend="sparse", pattern="data_[01].txt")
+    ...     with open(output + ".checkpoint", "a", encoding="utf-8") as stream:
+    ...         _ = stream.write('{"ids": ["data_2.txt"], "si')
+    ...     describe_collection(tmp, output, backend="sparse")
+    ...     describe_collection(tmp, output, backend="sparse")
+    ...     frame = pandas.read_csv(output, index_col=0)
+    ...     done, _ = read_checkpoint(output + ".checkpoint")
+    2
+    1
+    0
+    >>> frame.index.tolist()
+    ['data_0.txt', 'data_1.txt', 'data_2.txt']
+    >>> sorted(done) == frame.index.tolist()
+    True
+    """
+    checkpoint = output + ".checkpoint" if checkpoint is None else checkpoint
+    done, size = read_checkpoint(checkpoint, repair=True)
+    if not done:
+        size = 0
+        with open(checkpoint, "w", encoding="utf-8"):
+            pass
+    if os.path.exists(output) and os.path.getsize(output) < size:
+        raise ValueError(f"{output} is shorter than its checkpoint {checkpoint}")
+    with open(output, "a", encoding="utf-8"):
+        pass
+    os.truncate(output, size)
+    count = 0
+    with (
+        ProcessPoolExecutor(workers) if workers > 1 else nullcontext()
+    ) as executor, open(checkpoint, "a", encoding="utf-8") as stream:
+        for batch in prefetch(
+            partition_all(batch_size, iter_samples(source, pattern, skip=done)),
+            size=prefetch_batches,
+        ):
+            ids, samples = zip(*batch)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                frame = make_descriptors(
+                    np.array(samples),
+                    executor=executor,
+                    descriptors=descriptors,
+                    backend=backend,
+                )
+            for i, error in frame.attrs["failures"].items():
+                warnings.warn(f"descriptors failed for {ids[i]}: {error}")
+            frame.index = list(ids)
+            frame.index.name = "sample"
+            frame = frame.drop(index=[ids[i] for i in frame.attrs["failures"]])
+            if len(frame) > 0:
+                frame.to_csv(output, mode="a", header=os.path.getsize(output) == 0)
+            stream.write(
+                json.dumps({"ids": list(frame.index), "size": os.path.getsize(output)})
+                + "\n"
+            )
+            stream.flush()
+            count += len(frame)
+            if log is not None:
+                print(
+                    f"{output}: {len(done) + count} samples written",
+                    file=log,
+                    flush=True,
+                )
+    return count
+
+
+def parse_args(argv=None):
+    """The arguments of the `pygraspi` command
+
+    >>> args = parse_args(["samples.zip", "out.csv", "--descriptors", "a,b"])
+    >>> args.descriptors, args.workers, args.backend
+    (['a', 'b'], 1, 'graph-tool')
+    """
+    parser = argparse.ArgumentParser(
+        prog="pygraspi",
+        description="Write the descriptors of a collection of microstructures "
+        "to a CSV table, resuming an interrupted run.",
+    )
+    parser.add_argument(
+        "source", help="a directory of sample files, a zip archive or a .npy stack"
+    )
+    parser.add_argument("output", help="the CSV table of descriptors")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="the number of worker processes"
+    )
+    parser.add_argument(
+        "--descriptors",
+        type=lambda x: x.split(","),
+        help="the comma separated descriptors to calculate, all of them by default",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(GRASPI_BACKENDS),
+        default="graph-tool",
+        help="the backend of the graph descriptors",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="the samples in each batch"
+    )
+    parser.add_argument(
+        "--pattern",
+        default="data_*.txt",
+        help="the names of the sample files in a directory or zip archive",
+    )
+    parser.add_argument(
+        "--checkpoint", help="the checkpoint file, <output>.checkpoint by default"
+    )
+    parser.add_argument(
+        "--prefetch", type=int, default=1, help="the batches to read ahead"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the `pygraspi` command"""
+    args = parse_args(argv)
+    describe_collection(
+        args.source,
+        args.output,
+        workers=args.workers,
+        descriptors=args.descriptors,
+        backend=args.backend,
+        batch_size=args.batch_size,
+        pattern=args.pattern,
+        checkpoint=args.checkpoint,
+        prefetch_batches=args.prefetch,
+        log=sys.stderr,
+    )
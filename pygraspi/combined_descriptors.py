@@ -1,28 +1,375 @@
 """The main PyGraSPI module with the public API
+
+The graph backends, pandas and the libraries of the skeletons are
+imported when first used, so that importing this module, as each new
+worker process does, is quick and does not need graph-tool.
+
+>>> import subprocess, sys
+>>> code = (
+...     "import sys, time; start = time.perf_counter();"
+...     "import pygraspi.combined_descriptors;"
+...     "print(time.perf_counter() - start);"
+...     "print(sorted(set(sys.modules) & {'graph_tool', 'networkx', "
+...     "'pandas', 'skimage', 'sknw'}))"
+... )
+>>> seconds, loaded = subprocess.run(
+...     [sys.executable, "-c", code], capture_output=True, text=True, check=True
+... ).stdout.split()
+>>> loaded
+'[]'
+>>> assert float(seconds) < IMPORT_TIME_BUDGET
 """
 
-import pandas as pd
-from toolz.curried import map as fmap
-from toolz.curried import pipe
+import importlib
+import warnings
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+from toolz.curried import partition_all, peek
+
+from .array_descriptors import BATCH_COLUMNS, batch_descriptors
+from .cache import sample_key
+from .descriptor_plan import descriptor_names
+from .profiling import PROFILE_COLUMNS
+from .skeletal_descriptors import SKELETAL_COLUMNS, getSkeletalDescriptors
+
+## The modules with the `getGraspiDescriptors` of each backend, which
+## all give the same columns
+GRASPI_BACKENDS = {
+    "graph-tool": ".graph_graphtool",
+    "sparse": ".graph_sparse",
+    "array": ".array_descriptors",
+}
+
+## The backends of periodic microstructures, the graph backends
+PERIODIC_BACKENDS = ("graph-tool", "sparse")
+
+## The seconds `import pygraspi.combined_descriptors` may take
+IMPORT_TIME_BUDGET = 2.0
+
+
+def _pandas():
+    """pandas, only imported by the process that builds the dataframes"""
+    import pandas  # pylint: disable=import-outside-toplevel
+
+    return pandas
+
+
+def _split_descriptors(descriptors):
+    """The requested skeletal and graph descriptors, `None` for all"""
+    if descriptors is None:
+        return None, None
+    return (
+        [x for x in descriptors if x in SKELETAL_COLUMNS],
+        [x for x in descriptors if x not in SKELETAL_COLUMNS],
+    )
+
+
+def _batch_columns(data, descriptors=None, periodic=False):
+    """The columns of `BATCH_COLUMNS` calculated for all the samples at once
+
+    Returns:
+      the batched columns of each sample and the descriptors left to
+      calculate sample by sample, as is when the samples differ in
+      shape
+    """
+    if len({np.shape(x) for x in data}) != 1:
+        return [{} for _ in data], descriptors
+    data = np.asarray(data)
+    if descriptors is None:
+        descriptors = list(SKELETAL_COLUMNS) + descriptor_names(data.shape[1:])
+    columns = batch_descriptors(
+        data, [x for x in descriptors if x in BATCH_COLUMNS], periodic
+    )
+    rows = [dict(zip(columns, x)) for x in zip(*map(list, columns.values()))]
+    return rows or [{} for _ in data], [
+        x for x in descriptors if x not in BATCH_COLUMNS
+    ]
+
+
+def _recorder(records, sample):
+    """A `profile` callback adding the records of a sample to `records`"""
+    if records is None:
+        return None
+    return lambda record: records.append({"sample": sample, **record})
+
+
+def _graspi_backend(backend, periodic=False):
+    """The `getGraspiDescriptors` of a backend, imported on first use
+
+    Raises `ValueError` for an unknown backend, or a periodic one that
+    is not in `PERIODIC_BACKENDS`, before any sample is calculated.
+    """
+    if backend not in GRASPI_BACKENDS:
+        raise ValueError(
+            f"unknown backend {backend!r}, expected one of {list(GRASPI_BACKENDS)}"
+        )
+    if np.any(periodic) and backend not in PERIODIC_BACKENDS:
+        raise ValueError(
+            f"the {backend} backend is not periodic, "
+            f"use one of {list(PERIODIC_BACKENDS)}"
+        )
+    try:
+        module = importlib.import_module(GRASPI_BACKENDS[backend], __package__)
+    except ImportError as error:
+        raise ImportError(
+            f"the {backend} backend is not available ({error}), "
+            'use backend="sparse" or backend="array" instead'
+        ) from error
+    return module.getGraspiDescriptors
+
 
-from .skeletal_descriptors import getSkeletalDescriptors
-from .graph_graphtool import getGraspiDescriptors
+def _describe_sample(  # pylint: disable=too-many-arguments
+    sample, descriptors=None, row=None, *, profile=None, backend, periodic=False
+):
+    skeletal, graspi = _split_descriptors(descriptors)
+    graspi_descriptors = _graspi_backend(backend)
+    try:
+        return (
+            getSkeletalDescriptors(sample, descriptors=skeletal, profile=profile),
+            {
+                **(row or {}),
+                **graspi_descriptors(
+                    sample, descriptors=graspi, profile=profile, periodic=periodic
+                ),
+            },
+            None,
+        )
+    except Exception as error:  # pylint: disable=broad-except
+        return None, None, repr(error)
 
 
-def _map_to_dataframe(func, data):
-    return pipe(
-        data,
-        fmap(func),
-        list,
-        lambda x: pd.DataFrame(x, columns=sorted(x[0].keys())),
+def _describe_chunk(  # pylint: disable=too-many-arguments
+    data, indices, descriptors=None, *, profile=False, backend, periodic=False
+):
+    """Calculate the descriptors for some of the samples
+
+    Each result is followed by the profile records of the sample, or
+    `None` without `profile`.
+    """
+    rows, descriptors = _batch_columns(
+        [data[i] for i in indices], descriptors, periodic
+    )
+    result = []
+    for i, row in zip(indices, rows):
+        records = [] if profile else None
+        result.append(
+            _describe_sample(
+                data[i],
+                descriptors,
+                row,
+                profile=_recorder(records, i),
+                backend=backend,
+                periodic=periodic,
+            )
+            + (records,)
+        )
+    return result
+
+
+def _describe_all(data, descriptors=None, **kwargs):
+    """Calculate the descriptors for all the samples as `_describe_chunk`"""
+    return _describe_chunk(data, range(len(data)), descriptors, **kwargs)
+
+
+def _describe_shared(name, shape, dtype, indices, *args, **kwargs):
+    """Calculate the descriptors for samples held in shared memory"""
+    shared = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=dtype, buffer=shared.buf)
+    try:
+        return _describe_chunk(data, indices, *args, **kwargs)
+    finally:
+        del data
+        shared.close()
+
+
+def _describe_mapped(source, indices, *args, **kwargs):
+    """Calculate the descriptors for samples in a file from `_mapped_file`"""
+    filename, offset, shape, dtype = source
+    data = np.memmap(filename, dtype=dtype, mode="r", shape=shape, offset=offset)
+    return _describe_chunk(data, indices, *args, **kwargs)
+
+
+def _mapped_file(data):
+    """The file, offset, shape and type of samples memory mapped from a
+    file, such as those from `open_stack`, or `None` for other arrays"""
+    if not isinstance(data, np.memmap) or not data.flags.c_contiguous:
+        return None
+    ## A slice of a memory map keeps the offset of the map it came from
+    mapped = data
+    while isinstance(mapped.base, np.memmap):
+        mapped = mapped.base
+    if mapped.filename is None:
+        return None
+    offset = mapped.offset + data.ctypes.data - mapped.ctypes.data
+    return mapped.filename, offset, data.shape, data.dtype.str
+
+
+def _describe_parallel(  # pylint: disable=too-many-arguments
+    data, executor, chunk_size, descriptors=None, *, profile=False, **kwargs
+):
+    """Calculate the descriptors in chunks of samples on an executor
+
+    The samples are copied once into shared memory that the workers
+    attach to, rather than being pickled for every task. Samples
+    memory mapped from a file are not copied, the workers map the
+    same file.
+    """
+    chunks = [
+        range(start, min(start + chunk_size, len(data)))
+        for start in range(0, len(data), chunk_size)
+    ]
+    kwargs["profile"] = profile
+    source = _mapped_file(data)
+    if source is not None:
+        futures = [
+            executor.submit(_describe_mapped, source, x, descriptors, **kwargs)
+            for x in chunks
+        ]
+        return [x for future in futures for x in future.result()]
+    shared = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shared.buf)[:] = data
+        futures = [
+            executor.submit(
+                _describe_shared,
+                shared.name,
+                data.shape,
+                data.dtype.str,
+                x,
+                descriptors,
+                **kwargs,
+            )
+            for x in chunks
+        ]
+        return [x for future in futures for x in future.result()]
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def _describe_cached(data, cache, descriptors, describe, periodic=False):
+    """The results of `_describe_chunk` for every sample, calculated
+    with `describe` only for the samples missing from a cache
+
+    The results of the samples that did not fail are stored in the
+    cache, the profile records are those of the calculated samples.
+    """
+    keys = [sample_key(x, descriptors, periodic=periodic) for x in data]
+    results = [None if x is None else (*x, None, []) for x in map(cache.get, keys)]
+    misses = [i for i, x in enumerate(results) if x is None]
+    if not misses:
+        return results
+    computed = describe(data if len(misses) == len(data) else np.asarray(data)[misses])
+    for i, result in zip(misses, computed):
+        if result[2] is None:
+            cache.put(keys[i], result[:2])
+        records = [{**x, "sample": i} for x in result[3] or []]
+        results[i] = result[:3] + (records,)
+    return results
+
+
+def _results_to_dataframe(results, keep_failures=True):
+    """The dataframe of the results of `_describe_chunk`, with an empty
+    row for each sample that failed unless `keep_failures` is false"""
+    failures = {i: x[2] for i, x in enumerate(results) if x[2] is not None}
+    for index, error in failures.items():
+        warnings.warn(f"descriptors failed for sample {index}: {error}")
+    index = [i for i in range(len(results)) if i not in failures]
+
+    def to_dataframe(rows):
+        frame = _pandas().DataFrame(
+            rows, index=index, columns=sorted(rows[0].keys()) if rows else None
+        )
+        return frame.reindex(range(len(results))) if keep_failures else frame
+
+    frame = _pandas().concat(
+        [
+            to_dataframe([x[0] for x in results if x[2] is None]),
+            to_dataframe([x[1] for x in results if x[2] is None]),
+        ],
+        axis=1,
+        join="inner",
     )
+    frame.attrs["failures"] = failures
+    return frame
 
 
-def make_descriptors(data):
+def _descriptor_columns(shape, descriptors=None):
+    """The columns of `make_descriptors` for samples of a shape"""
+    if descriptors is None:
+        return sorted(SKELETAL_COLUMNS) + sorted(descriptor_names(shape))
+    skeletal, graspi = _split_descriptors(descriptors)
+    return sorted(skeletal) + sorted(graspi)
+
+
+def _profile_to_dataframe(records, profile):
+    """The profile records by sample, each passed to `profile` if it is a
+    function, which is only called here, after all the samples"""
+    records = sorted(records, key=lambda x: x["sample"])
+    if callable(profile):
+        for record in records:
+            profile(record)
+    return _pandas().DataFrame(records, columns=list(PROFILE_COLUMNS))
+
+
+def make_descriptors(  # pylint: disable=too-many-arguments
+    data,
+    n_workers=None,
+    chunk_size=1,
+    executor=None,
+    descriptors=None,
+    *,
+    profile=False,
+    backend="graph-tool",
+    cache=None,
+    periodic=False,
+):
     """Generate microstructure descriptors
 
     Args:
       data: the microstructure morphologies, (n_sample, n_x, n_y, ...)
+      n_workers: the number of worker processes, the samples are
+        calculated serially when neither `n_workers` nor `executor`
+        is given
+      chunk_size: the number of samples in each task submitted to
+        the workers
+      executor: a `concurrent.futures` style executor to use instead
+        of a process pool with `n_workers` processes
+      descriptors: the columns to calculate, all of them by default.
+        Only the intermediates those columns need are calculated,
+        for example no skeleton without a skeletal column.
+        The columns that are counts over the pixels, listed in
+        `BATCH_COLUMNS` of `array_descriptors`, are calculated for
+        all the samples at once.
+      profile: `True` to record the wall time and the bytes allocated
+        by each stage of each sample, such as a skeleton or a search
+        of the graph, in a dataframe with the columns
+        `PROFILE_COLUMNS` in the `profile` attribute. A function is
+        also called with each record, for example to feed a metrics
+        system. It is called once all the samples are calculated, in
+        the order of the samples, as the records of the worker
+        processes only come back with their results. The batched
+        columns are not recorded.
+      backend: the backend of the graph descriptors from
+        `GRASPI_BACKENDS`, "graph-tool", "sparse" for
+        `scipy.sparse.csgraph` or "array" for the image array, which
+        all give the same columns
+      cache: a `DescriptorCache` from `pygraspi.cache` of the
+        descriptors of samples calculated before, keyed by their
+        content. Only the samples missing from the cache are
+        calculated, as without `n_workers` or in parallel, and then
+        stored.
+      periodic: whether the microstructures wrap around each axis,
+        `True` for every axis or a flag for each, as for periodic
+        simulations. The components, the interface and the distances
+        of the graph descriptors then wrap around the periodic axes,
+        except the searches from a face, which do not wrap around
+        its axis. The skeletal descriptors are calculated on the
+        image as it is. Only the graph backends are periodic.
     Returns:
       a pandas dataframe of samples by features
     The methods used here first represent the microstructures topology
@@ -49,6 +396,8 @@ def make_descriptors(data):
     f_skeletal_pixels_a       fraction of skeleton pixels in phase 0
     f_skeletal_pixels_b       fraction of skeleton pixels in phase 1
     interfacial_area          number of pixels on the interface
+    mean_tortuosity_0         average tortuosity of the paths from phase 0 to the right boundary
+    mean_tortuosity_1         average tortuosity of the paths from phase 1 to the left boundary
     number_of_branches_a      number of branches on the skeleton graph in phase 0
     number_of_branches_b      number of branches on the skeleton graph in phase 1
     number_of_ends_a          number of branch ends on the skeleton graph in phase 0
@@ -61,6 +410,8 @@ def make_descriptors(data):
     phase_1_cc                number of connected components in phase 1
     phase_1_count             number of pixels in phase 1
     phase_1_interface         number of pixels on the interface in phase 1
+    straight_path_fraction_0  fraction of phase 0 pixels connected to the right boundary with a straight path
+    straight_path_fraction_1  fraction of phase 1 pixels connected to the left boundary with a straight path
     ========================= ===========
 
     Test case
@@ -70,19 +421,315 @@ def make_descriptors(data):
     ...     [[0, 0, 0], [1, 1, 1], [0, 0, 0], [1, 0, 0], [1, 0, 1]],
     ...     [[0, 1, 1], [1, 1, 1], [0, 0, 0], [1, 0, 0], [1, 0, 1]]
     ... ])
-    >>> actual = make_descriptors(data)
+    >>> actual = make_descriptors(data, backend="sparse")
     >>> actual
        branch_length_a  branch_length_b  ...  top_boundary_count_0  top_boundary_count_1
     0             2.00             2.91  ...                     3                     0
     1             2.41             3.83  ...                     1                     2
     <BLANKLINE>
-    [2 rows x 40 columns]
+    [2 rows x 44 columns]
+
+    The samples can be calculated in parallel. The rows are in the
+    same order as the samples.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(2) as executor:
+    ...     parallel = make_descriptors(data, executor=executor, backend="sparse")
+    >>> assert parallel.equals(actual)
+
+    When the descriptors cannot be calculated for a sample, a warning
+    is issued and the row for that sample is left empty, serially and
+    in parallel alike. The failures are kept by sample index in the
+    `failures` attribute.
+
+    >>> import warnings
+    >>> data = np.concatenate([data, np.zeros((1, 5, 3), dtype=int)])
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter("ignore")
+    ...     actual = make_descriptors(data, n_workers=2, chunk_size=2, backend="sparse")
+    ...     serial = make_descriptors(data, backend="sparse")
+    >>> assert actual.iloc[2].isna().all()
+    >>> assert list(actual.attrs["failures"]) == [2]
+    >>> assert serial.equals(actual)
+    >>> assert list(serial.attrs["failures"]) == [2]
+
+    A subset of the columns can be requested.
+
+    >>> make_descriptors(
+    ...     data[:2], descriptors=["phase_0_cc", "number_of_ends_a"], backend="sparse"
+    ... )
+       number_of_ends_a  phase_0_cc
+    0                 2           1
+    1                 2           1
+
+    The time and memory of each stage are recorded with `profile`.
+
+    >>> actual = make_descriptors(data[:2], profile=True, backend="sparse")
+    >>> profile = actual.attrs["profile"]
+    >>> profile.columns.tolist()
+    ['sample', 'stage', 'seconds', 'bytes']
+    >>> profile[profile["sample"] == 0]["stage"].tolist()[:4]
+    ['scores', 'skeleton a', 'skeleton b', 'topology a']
+
+    The backends give the same descriptors, and graph-tool is only
+    needed by its own backend.
+
+    >>> from importlib.util import find_spec
+    >>> sparse = make_descriptors(data[:2], backend="sparse")
+    >>> assert sparse.equals(make_descriptors(data[:2], backend="array"))
+    >>> if find_spec("graph_tool") is not None:
+    ...     assert sparse.equals(make_descriptors(data[:2], backend="graph-tool"))
+
+    The samples of a stack from `datasets.open_stack` are passed to
+    the workers as the file, which each worker maps.
+
+    >>> import os, tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     stack = os.path.join(tmp, "samples.npy")
+    ...     np.save(stack, data[:2])
+    ...     mapped = np.load(stack, mmap_mode="r")
+    ...     with ThreadPoolExecutor(2) as executor:
+    ...         actual = make_descriptors(
+    ...             mapped[1:], executor=executor, backend="sparse"
+    ...         )
+    ...     del mapped
+    >>> assert actual.iloc[0].equals(sparse.iloc[1])
+
+    With a cache, the samples calculated before are not calculated
+    again.
+
+    >>> from pygraspi.cache import DescriptorCache
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     cache = DescriptorCache(tmp)
+    ...     first = make_descriptors(data[:2], cache=cache, backend="sparse")
+    ...     with warnings.catch_warnings():
+    ...         warnings.simplefilter("ignore")
+    ...         second = make_descriptors(data, cache=cache, backend="sparse")
+    >>> cache.counts
+    Counter({'misses': 3, 'hits': 2})
+    >>> assert first.equals(sparse)
+    >>> assert (second.iloc[:2] == sparse).all(axis=None)
+    >>> list(second.attrs["failures"])
+    [2]
+
+    Periodic microstructures wrap around their faces, here joining
+    the phase 0 pixels on the top and bottom faces of the second
+    sample.
+
+    >>> make_descriptors(
+    ...     data[:2], descriptors=["phase_0_cc"], periodic=(True,), backend="sparse"
+    ... )
+       phase_0_cc
+    0           1
+    1           1
+
+    The array backend is not periodic.
+
+    >>> make_descriptors(data[:2], backend="array", periodic=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: the array backend is not periodic, use one of ['graph-tool', 'sparse']
     """  # pylint: disable=line-too-long
-    return pd.concat(
-        [
-            _map_to_dataframe(getSkeletalDescriptors, data),
-            _map_to_dataframe(getGraspiDescriptors, data),
-        ],
-        axis=1,
-        join="inner",
+    _graspi_backend(backend, periodic)
+    kwargs = {"profile": bool(profile), "backend": backend, "periodic": periodic}
+    with (
+        ProcessPoolExecutor(n_workers)
+        if executor is None and n_workers is not None
+        else nullcontext(executor)
+    ) as pool:
+        describe = (
+            partial(_describe_all, descriptors=descriptors, **kwargs)
+            if pool is None
+            else partial(
+                _describe_parallel,
+                executor=pool,
+                chunk_size=chunk_size,
+                descriptors=descriptors,
+                **kwargs,
+            )
+        )
+        results = (
+            describe(data)
+            if cache is None
+            else _describe_cached(data, cache, descriptors, describe, periodic)
+        )
+    frame = _results_to_dataframe(results)
+    if profile:
+        frame.attrs["profile"] = _profile_to_dataframe(
+            [record for x in results for record in x[3]], profile
+        )
+    return frame
+
+
+def iter_descriptors(  # pylint: disable=too-many-arguments
+    samples,
+    batch_size=100,
+    descriptors=None,
+    backend="graph-tool",
+    periodic=False,
+    *,
+    drop_failures=False,
+):
+    """Generate microstructure descriptors in batches of samples
+
+    Only one batch of samples and descriptors is held at a time, so
+    the memory use does not grow with the number of samples.
+
+    Args:
+      samples: an iterable of microstructures, each an `(n_x, n_y,
+        ...)` shaped array
+      batch_size: the number of samples in each batch
+      descriptors: the columns to calculate, as in `make_descriptors`
+      backend: the backend of the graph descriptors, as in
+        `make_descriptors`
+      periodic: whether the microstructures wrap around each axis, as
+        in `make_descriptors`
+      drop_failures: leave out the rows of the samples that fail,
+        rather than leave them empty, which keeps the integer columns
+        as integers
+    Returns:
+      a generator of pandas dataframes of samples by features with
+      the same columns as `make_descriptors`, indexed by the position
+      of each sample in `samples`
+
+    >>> import numpy as np
+    >>> samples = (np.array([[0, 0, 0], [1, 1, 1], [0, 0, i]]) for i in range(5))
+    >>> [len(x) for x in iter_descriptors(samples, batch_size=2, backend="sparse")]
+    [2, 2, 1]
+
+    The samples that fail are kept by position in the `failures`
+    attribute of their batch, as in `make_descriptors`.
+
+    >>> import warnings
+    >>> samples = [np.array([[0, 0, 0], [1, 1, 1], [0, 0, 1]]), np.zeros((3, 3))] * 2
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter("ignore")
+    ...     frames = list(iter_descriptors(samples, batch_size=3, backend="sparse"))
+    >>> [list(x.attrs["failures"]) for x in frames]
+    [[1], [3]]
+    """
+    _graspi_backend(backend, periodic)
+    start = 0
+    for batch in partition_all(batch_size, samples):
+        frame = _results_to_dataframe(
+            _describe_all(
+                batch,
+                descriptors,
+                profile=False,
+                backend=backend,
+                periodic=periodic,
+            ),
+            keep_failures=not drop_failures,
+        )
+        frame.index += start
+        frame.attrs["failures"] = {
+            i + start: x for i, x in frame.attrs["failures"].items()
+        }
+        start += len(batch)
+        yield frame
+
+
+def write_descriptors(  # pylint: disable=too-many-arguments
+    samples,
+    path,
+    batch_size=100,
+    descriptors=None,
+    backend="graph-tool",
+    *,
+    periodic=False,
+):
+    """Write microstructure descriptors to a file batch by batch
+
+    Each batch from `iter_descriptors` is appended to the file as soon
+    as it is calculated. The columns are those of `make_descriptors`
+    for the shape of the first sample, whichever samples fail. The
+    samples that fail are warned about and left out, so the rows are
+    indexed by the position of each sample written. Parquet files
+    require pyarrow.
+
+    Args:
+      samples: an iterable of microstructures
+      path: a CSV file, or a Parquet file when the name ends with
+        `.parquet`
+      batch_size: the number of samples in each batch
+      descriptors: the columns to calculate, as in `make_descriptors`
+      backend: the backend of the graph descriptors, as in
+        `make_descriptors`
+      periodic: whether the microstructures wrap around each axis, as
+        in `make_descriptors`
+    Returns:
+      the number of samples written
+
+    >>> import os, tempfile, warnings
+    >>> import pandas
+    >>> import numpy as np
+    >>> samples = [np.array([[0, 0, 0], [1, 1, 1], [0, 0, i]]) for i in range(5)]
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "descriptors.csv")
+    ...     assert write_descriptors(samples, path, 2, backend="sparse") == 5
+    ...     pandas.read_csv(path, index_col=0).shape
+    (5, 44)
+
+    A batch of samples that all fail, here with a single phase, leaves
+    out their rows from both formats.
+
+    >>> failing = [np.zeros((3, 3), dtype=int)] * 2 + samples[:2] + [np.ones((3, 3))]
+    >>> with tempfile.TemporaryDirectory() as tmp, warnings.catch_warnings():
+    ...     warnings.simplefilter("ignore")
+    ...     for name in ["descriptors.csv", "descriptors.parquet"]:
+    ...         path = os.path.join(tmp, name)
+    ...         assert write_descriptors(failing, path, 2, backend="sparse") == 2
+    ...     csv = pandas.read_csv(path[: -len(".parquet")] + ".csv", index_col=0)
+    ...     parquet = pandas.read_parquet(path)
+    >>> csv.shape, parquet.index.tolist(), parquet["phase_0_cc"].dtype
+    ((2, 44), [2, 3], dtype('int64'))
+    >>> assert (csv.values == parquet.values).all()
+    """
+    try:
+        first, samples = peek(samples)
+    except StopIteration:
+        return 0
+    columns = _descriptor_columns(np.shape(first), descriptors)
+    batches = (
+        frame[columns]
+        for frame in iter_descriptors(
+            samples,
+            batch_size=batch_size,
+            descriptors=descriptors,
+            backend=backend,
+            periodic=periodic,
+            drop_failures=True,
+        )
+        if len(frame) > 0
     )
+    count = 0
+    if str(path).endswith(".parquet"):
+        # pylint: disable=import-outside-toplevel,import-error
+        import pyarrow
+        import pyarrow.parquet
+
+        writer = None
+        try:
+            for frame in batches:
+                table = pyarrow.Table.from_pandas(
+                    frame, schema=writer and writer.schema
+                )
+                writer = writer or pyarrow.parquet.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                count += len(frame)
+            if writer is None:
+                pyarrow.parquet.write_table(
+                    pyarrow.Table.from_pandas(
+                        _pandas().DataFrame(columns=columns, dtype=float)
+                    ),
+                    path,
+                )
+        finally:
+            if writer is not None:
+                writer.close()
+        return count
+    _pandas().DataFrame(columns=columns).to_csv(path)
+    for frame in batches:
+        frame.to_csv(path, mode="a", header=False)
+        count += len(frame)
+    return count
@@ -0,0 +1,233 @@
+"""Reads collections of microstructures such as the Cahn-Hilliard
+samples in `notebooks/data/cahn-hilliard.zip`.
+
+A collection can be packed once with `pack_zip` into a binary stack,
+a `.npy` file of all the samples with a JSON index of the metadata
+in their file names. The stack is opened with `open_stack` as a
+memory map, so the samples are read from the file as they are used
+rather than parsed from text.
+"""
+
+import fnmatch
+import json
+import os
+import posixpath
+import re
+import zipfile
+
+import numpy as np
+
+## The metadata in the file names of the Cahn-Hilliard samples,
+## `data_<phi>_<chi>_<step>.txt`
+NAME_PATTERN = re.compile(r"data_(?P<phi>[^_]+)_(?P<chi>[^_]+)_(?P<step>\d+)\.txt$")
+
+
+def read_sample(stream):
+    """Read a single whitespace-delimited microstructure
+
+    The rows of the file are the columns of the microstructure, as in
+    `notebooks/intro.ipynb`.
+
+    Args:
+      stream: a file name or an open file
+
+    Returns:
+      the microstructure as an integer array
+    """
+    return np.loadtxt(stream, dtype=int).T
+
+
+def iter_zip(path, pattern="data_*.txt"):
+    """Read the microstructures in a zip archive one at a time
+
+    Only one member of the archive is read and parsed at a time, so
+    the archive can be streamed into `iter_descriptors`.
+
+    Args:
+      path: the zip archive
+      pattern: only members with a file name matching this pattern
+        are read
+
+    Returns:
+      a generator of microstructures, in the order of the archive
+
+    >>> samples = iter_zip("notebooks/data/cahn-hilliard.zip")
+    >>> next(samples).shape
+    (401, 101)
+    >>> samples.close()
+    """
+    for _, sample in _iter_members(path, pattern):
+        yield sample
+
+
+def _members(archive, pattern):
+    return [
+        x for x in archive.namelist() if fnmatch.fnmatch(posixpath.basename(x), pattern)
+    ]
+
+
+def _iter_members(path, pattern):
+    """The name and the microstructure of each member of a zip archive"""
+    with zipfile.ZipFile(path) as archive:
+        for name in _members(archive, pattern):
+            with archive.open(name) as stream:
+                yield name, read_sample(stream)
+
+
+def iter_samples(path, pattern="data_*.txt", skip=()):
+    """Read the microstructures of a directory, zip archive or stack
+    one at a time, with an id for each
+
+    The id of a sample is its file name in a directory, its member
+    name in a zip archive, and its name in the index of a stack from
+    `pack_zip`, or its position when the stack has no index. The
+    samples with an id in `skip` are not read.
+
+    Args:
+      path: a directory of sample files, a zip archive or a `.npy`
+        stack
+      pattern: only files or members with a file name matching this
+        pattern are read, unused for a stack
+      skip: the ids of samples to leave out
+
+    Returns:
+      a generator of the id and the microstructure of each sample, in
+      the order of the names in a directory and in the order of an
+      archive or stack
+
+    >>> samples = iter_samples(
+    ...     "notebooks/data/cahn-hilliard.zip",
+    ...     "data_0.514_2.4_0001*.txt",
+    ...     skip={"cahn-hilliard/data_0.514_2.4_000100.txt"},
+    ... )
+    >>> [(name, sample.shape) for name, sample in samples][0]
+    ('cahn-hilliard/data_0.514_2.4_000140.txt', (401, 101))
+    """
+    skip = set(skip)
+    if os.path.isdir(path):
+        for name in sorted(fnmatch.filter(os.listdir(path), pattern)):
+            if name not in skip:
+                yield name, read_sample(os.path.join(path, name))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in _members(archive, pattern):
+                if name not in skip:
+                    with archive.open(name) as stream:
+                        yield name, read_sample(stream)
+    else:
+        samples, index = open_stack(path)
+        for i, sample in enumerate(samples):
+            name = str(i) if index is None else index[i]["name"]
+            if name not in skip:
+                yield name, np.array(sample)
+
+
+def parse_name(name):
+    """The metadata in the file name of a sample
+
+    Args:
+      name: the file name, with or without a directory
+
+    Returns:
+      the file name with the `phi`, `chi` and `step` of
+      `NAME_PATTERN`, which are `None` when the name does not match
+
+    >>> parse_name("cahn-hilliard/data_0.514_2.4_000080.txt")
+    {'name': 'data_0.514_2.4_000080.txt', 'phi': 0.514, 'chi': 2.4, 'step': 80}
+    >>> parse_name("sample.txt")["phi"] is None
+    True
+    """
+    name = posixpath.basename(name)
+    match = NAME_PATTERN.match(name)
+    if match is None:
+        return dict(name=name, phi=None, chi=None, step=None)
+    return dict(
+        name=name,
+        phi=float(match["phi"]),
+        chi=float(match["chi"]),
+        step=int(match["step"]),
+    )
+
+
+def index_path(path):
+    """The JSON index next to a stack, `samples.json` for `samples.npy`"""
+    return os.path.splitext(path)[0] + ".json"
+
+
+def pack_zip(path, stack, pattern="data_*.txt", dtype=np.uint8):
+    """Pack the microstructures of a zip archive into a binary stack
+
+    The samples are written one at a time into a `.npy` file of
+    shape `(n_sample, n_x, n_y, ...)`, with the metadata of each from
+    `parse_name` in the JSON index at `index_path(stack)`. All the
+    samples must have the same shape.
+
+    Args:
+      path: the zip archive
+      stack: the `.npy` file to write
+      pattern: only members with a file name matching this pattern
+        are packed
+      dtype: the type of the stored samples, which must hold every
+        phase
+
+    Returns:
+      the index, the metadata of each sample in the order of the stack
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     stack = os.path.join(tmp, "cahn-hilliard.npy")
+    ...     index = pack_zip(
+    ...         "notebooks/data/cahn-hilliard.zip", stack, "data_0.514_2.4_0001*.txt"
+    ...     )
+    ...     samples, _ = open_stack(stack)
+    ...     samples.shape, samples.dtype
+    ((4, 401, 101), dtype('uint8'))
+    >>> [x["step"] for x in index]
+    [100, 140, 160, 180]
+    """
+    with zipfile.ZipFile(path) as archive:
+        n_sample = len(_members(archive, pattern))
+    if n_sample == 0:
+        raise ValueError(f"no members of {path} match {pattern!r}")
+    out = None
+    index = []
+    for i, (name, sample) in enumerate(_iter_members(path, pattern)):
+        if out is None:
+            out = np.lib.format.open_memmap(
+                stack, mode="w+", dtype=dtype, shape=(n_sample,) + sample.shape
+            )
+        if sample.shape != out.shape[1:]:
+            raise ValueError(
+                f"{name} has the shape {sample.shape}, not {out.shape[1:]}"
+            )
+        out[i] = sample
+        if not np.array_equal(out[i], sample):
+            raise ValueError(f"the phases of {name} do not fit in {np.dtype(dtype)}")
+        index.append(parse_name(name))
+    out.flush()
+    del out
+    with open(index_path(stack), "w", encoding="utf-8") as stream:
+        json.dump(index, stream)
+    return index
+
+
+def open_stack(stack):
+    """Open a binary stack from `pack_zip` without reading the samples
+
+    The samples are a read-only memory map of the file, so slicing
+    them copies nothing and only the pages of the samples that are
+    used are read. `make_descriptors` passes the file, rather than
+    the samples, to its worker processes, which map it themselves.
+
+    Args:
+      stack: the `.npy` file
+
+    Returns:
+      the samples and the index of their metadata, `None` when there
+      is no index
+    """
+    samples = np.load(stack, mmap_mode="r")
+    if not os.path.exists(index_path(stack)):
+        return samples, None
+    with open(index_path(stack), encoding="utf-8") as stream:
+        return samples, json.load(stream)
@@ -0,0 +1,237 @@
+"""The descriptors of `getGraspiDescriptors` from the intermediates of
+a graph, shared by the graph backends.
+
+A backend gives the searches of its graph in a subclass of
+`DescriptorPlan`, and the descriptors are calculated from those with
+`describe`, so that every backend has the same columns. The columns
+of microstructures with any number of phases, from
+`multiphase_columns`, generalise those of two phases.
+"""
+
+from collections import Counter
+from itertools import product
+from operator import methodcaller
+
+import numpy as np
+
+from .makeGridGraph import ELECTRODES, boundary_faces, face_axis, periodic_axes
+from .profiling import stage_name
+
+
+class DescriptorPlan:
+    """
+    The intermediates shared by the descriptors of one sample.
+
+    Each intermediate, such as a phase mask or a distance field, is
+    computed at most once, on first use, so only the intermediates of
+    the requested descriptors are computed. The searches over the
+    graph are counted as "traversals" in `counts`. Each intermediate
+    is a stage recorded by the `StageProfiler` given as `profile`.
+
+    A backend gives the `colors` of the vertices, starting with the
+    pixels, the pixels on the `interface`, the `interface_distance`,
+    the `boundary_distance` to a face, the `component_count` of a
+    phase, its `tortuosity` statistics and the pixels on each face in
+    `boundaries`.
+
+    The graph wraps around the `periodic` axes. The searches from a
+    face, to a boundary or an electrode, do not wrap around the axis
+    of that face, which is the edge of the device.
+    """
+
+    def __init__(self, data, counts=None, profile=None, periodic=False):
+        self.data = data
+        self.counts = Counter() if counts is None else counts
+        self.profile = profile
+        self.periodic = periodic_axes(periodic, data.shape)
+        self.n_pixels = data.size
+        self.interfacev = self.n_pixels
+        self._cache = {}
+
+    def _get(self, key, func):
+        if key not in self._cache:
+            if self.profile is None:
+                self._cache[key] = func()
+            else:
+                self._cache[key] = self.profile(stage_name(key), func)
+        return self._cache[key]
+
+    def _traverse(self, search, *args, **kwargs):
+        self.counts["traversals"] += 1
+        return search(*args, **kwargs)
+
+    def cut_axis(self, face):
+        """The axis that the searches from a face do not wrap around,
+        `None` unless it is periodic"""
+        axis = face_axis(face)
+        return axis if self.periodic[axis] else None
+
+    def mask(self, phase):
+        """The pixels of a phase"""
+        return self._get(("mask", phase), lambda: self.colors[: self.n_pixels] == phase)
+
+    def count(self, phase):
+        """The number of pixels of a phase"""
+        return int(self.mask(phase).sum())
+
+    def boundary_count(self, face, phase):
+        """The number of pixels of a phase on a face"""
+        return int(self.mask(phase)[self.boundaries[face]].sum())
+
+    def interface_count(self, phase=None):
+        """The number of interface pixels, in a phase if given"""
+        if phase is None:
+            return int(self.interface.sum())
+        return int((self.interface & self.mask(phase)).sum())
+
+    def mean_interface_distance(self, phase=None):
+        """The average distance to the interface, in a phase if given"""
+        if phase is None:
+            mask = self.colors[: self.n_pixels] >= 0
+        else:
+            mask = self.mask(phase)
+        return int(self.interface_distance[mask].sum()) / int(mask.sum())
+
+    def mean_boundary_distance(self, face, phase):
+        """The average distance of a phase to a face"""
+        return np.mean(self.boundary_distance(face)[self.mask(phase)])
+
+    def mean_tortuosity(self, phase):
+        """The mean tortuosity of a phase to its electrode"""
+        return self.tortuosity(phase)[0]
+
+    def straight_path_fraction(self, phase):
+        """The fraction of straight paths of a phase to its electrode"""
+        return self.tortuosity(phase)[1]
+
+
+def descriptor_columns(shape):
+    """Each descriptor column for a shape as a function of a `DescriptorPlan`"""
+    return dict(
+        phase_0_count=methodcaller("count", phase=0),
+        phase_1_count=methodcaller("count", phase=1),
+        phase_0_cc=methodcaller("component_count", phase=0),
+        phase_1_cc=methodcaller("component_count", phase=1),
+        interfacial_area=methodcaller("interface_count"),
+        phase_0_interface=methodcaller("interface_count", phase=0),
+        phase_1_interface=methodcaller("interface_count", phase=1),
+        distance_to_interface=methodcaller("mean_interface_distance"),
+        distance_to_interface_0=methodcaller("mean_interface_distance", phase=0),
+        distance_to_interface_1=methodcaller("mean_interface_distance", phase=1),
+        top_boundary_count_0=methodcaller("boundary_count", face="top", phase=0),
+        top_boundary_count_1=methodcaller("boundary_count", face="top", phase=1),
+        bottom_boundary_count_0=methodcaller("boundary_count", face="bottom", phase=0),
+        bottom_boundary_count_1=methodcaller("boundary_count", face="bottom", phase=1),
+        mean_tortuosity_0=methodcaller("mean_tortuosity", phase=0),
+        mean_tortuosity_1=methodcaller("mean_tortuosity", phase=1),
+        straight_path_fraction_0=methodcaller("straight_path_fraction", phase=0),
+        straight_path_fraction_1=methodcaller("straight_path_fraction", phase=1),
+        **{
+            f"distance_to_{face}_{phase}": methodcaller(
+                "mean_boundary_distance", face=face, phase=phase
+            )
+            for face, phase in product(boundary_faces(shape), (0, 1))
+        },
+    )
+
+
+def descriptor_names(shape):
+    """The names of the descriptors of `getGraspiDescriptors` for a shape
+
+    >>> len(descriptor_names((3, 3))), len(descriptor_names((3, 3, 3)))
+    (26, 30)
+    """
+    return list(descriptor_columns(shape))
+
+
+def multiphase_columns(shape, phases):
+    """Each descriptor column for a shape and any number of phases as a
+    function of a plan of `getMultiphaseDescriptors`
+
+    The columns of each phase have the suffixes of the two phase
+    columns, and `phase_<p>_interface_<q>` is the number of pixels of
+    phase `p` next to phase `q`. Only the phases with an electrode in
+    `ELECTRODES` have a tortuosity.
+
+    >>> columns = multiphase_columns((3, 3), (0, 1, 2))
+    >>> len(columns)
+    42
+    >>> [x for x in columns if x.startswith("phase_2_interface")]
+    ['phase_2_interface', 'phase_2_interface_0', 'phase_2_interface_1']
+    >>> assert set(descriptor_columns((3, 3))) < set(multiphase_columns((3, 3), (0, 1)))
+    """
+    electrodes = [x for x in phases if 0 <= x < len(ELECTRODES)]
+    return dict(
+        **{f"phase_{x}_count": methodcaller("count", phase=x) for x in phases},
+        **{f"phase_{x}_cc": methodcaller("component_count", phase=x) for x in phases},
+        interfacial_area=methodcaller("interface_count"),
+        **{
+            f"phase_{x}_interface": methodcaller("interface_count", phase=x)
+            for x in phases
+        },
+        **{
+            f"phase_{x}_interface_{y}": methodcaller("contact_count", phase=x, other=y)
+            for x, y in product(phases, phases)
+            if x != y
+        },
+        distance_to_interface=methodcaller("mean_interface_distance"),
+        **{
+            f"distance_to_interface_{x}": methodcaller(
+                "mean_interface_distance", phase=x
+            )
+            for x in phases
+        },
+        **{
+            f"{face}_boundary_count_{x}": methodcaller(
+                "boundary_count", face=face, phase=x
+            )
+            for face, x in product(("top", "bottom"), phases)
+        },
+        **{
+            f"mean_tortuosity_{x}": methodcaller("mean_tortuosity", phase=x)
+            for x in electrodes
+        },
+        **{
+            f"straight_path_fraction_{x}": methodcaller(
+                "straight_path_fraction", phase=x
+            )
+            for x in electrodes
+        },
+        **{
+            f"distance_to_{face}_{x}": methodcaller(
+                "mean_boundary_distance", face=face, phase=x
+            )
+            for face, x in product(boundary_faces(shape), phases)
+        },
+    )
+
+
+def multiphase_names(shape, phases):
+    """The names of the descriptors of `getMultiphaseDescriptors`
+
+    >>> multiphase_names((3, 3), (0, 1, 2))[:4]
+    ['phase_0_count', 'phase_1_count', 'phase_2_count', 'phase_0_cc']
+    """
+    return list(multiphase_columns(shape, phases))
+
+
+def describe(plan, descriptors=None, columns=None):
+    """The descriptors of the sample of a plan
+
+    Args:
+      plan: a `DescriptorPlan` of a backend
+      descriptors: the names of the descriptors to calculate, all of
+        them by default
+      columns: the functions of the plan for each column,
+        `descriptor_columns` by default
+
+    Returns:
+      the descriptors by name, in the order of the columns
+    """
+    if columns is None:
+        columns = descriptor_columns(plan.data.shape)
+    names = columns if descriptors is None else descriptors
+    unknown = set(names) - set(columns)
+    if unknown:
+        raise ValueError(f"unknown descriptors: {sorted(unknown)}")
+    return {name: columns[name](plan) for name in columns if name in names}
@@ -1,7 +1,12 @@
 import numpy as np
 import networkx as nx
 import doctest
-from .makeGridGraph import make_grid_graph
+from .makeGridGraph import (
+    ELECTRODES,
+    boundary_faces,
+    make_grid_graph,
+    tortuosity_statistics,
+)
 
 
 def makeImageGraph(morph):
@@ -192,8 +197,45 @@ def shortest_dist_boundary(G, phase):
     return sum(path_length) / len(path_length)
 
 
-def tortuosity(G, phase):
-    return None
+def tortuosity(G, shape, phase):
+    """
+    Calculate the tortuosity statistics of a phase to its electrode.
+
+    Phase 0 is collected at the first face of `ELECTRODES` and phase 1
+    at the second. A single multi-source search from the vertices of
+    the phase on the electrode gives the distances to every vertex of
+    the phase.
+
+    Args:
+        G: The network representing the input microstructure.
+        shape: the shape of the microstructure
+        phase : The identifier of the phase of interest.
+
+    >>> data = np.array([[1,0,0],\
+                [1,1,0],\
+                [0,1,0]])
+    >>> g = makeImageGraph(data)
+    >>> g = makeInterfaceEdges(g)
+    >>> assert(tortuosity(g, data.shape, 0).tolist() == [1.0, 1.0])
+    >>> assert(tortuosity(g, data.shape, 1).round(3).tolist() == [1.069, 1.0])
+    """
+    face = ELECTRODES[phase]
+    colors = nx.get_node_attributes(G, "color")
+    subgraph = G.subgraph(n for n, c in colors.items() if c == phase)
+    ids = np.arange(np.prod(shape)).reshape(shape)[boundary_faces(shape)[face]]
+    sources = [n for n in ids.flatten() if colors[n] == phase]
+
+    def length(u, v, _):
+        return np.linalg.norm(
+            np.subtract(np.unravel_index(u, shape), np.unravel_index(v, shape))
+        )
+
+    distance = np.full(np.prod(shape), np.inf)
+    if sources:
+        lengths = nx.multi_source_dijkstra_path_length(subgraph, sources, weight=length)
+        distance[list(lengths)] = np.array(list(lengths.values())) + 0.5
+    morph = np.array([colors[n] for n in range(np.prod(shape))]).reshape(shape)
+    return tortuosity_statistics(distance.reshape(shape), morph, phase, face)
 
 
 def interface_boundary(G, phase):
@@ -213,6 +255,8 @@ def getGraspiDescriptors(data):
     g = makeImageGraph(data)
     g = makeInterfaceEdges(g)
     [interface_area, phase_0_interface, phase_1_interface] = interfaceArea(g)
+    [mean_tortuosity_0, straight_path_fraction_0] = tortuosity(g, data.shape, 0)
+    [mean_tortuosity_1, straight_path_fraction_1] = tortuosity(g, data.shape, 1)
 
     return dict(
         phase_0_count=count_of_vertices(g, 0),
@@ -225,4 +269,8 @@ def getGraspiDescriptors(data):
         distance_to_interface=shortest_distances_all(g),
         distance_to_interface_0=shortest_distances_phase(g, 0),
         distance_to_interface_1=shortest_distances_phase(g, 1),
+        mean_tortuosity_0=mean_tortuosity_0,
+        mean_tortuosity_1=mean_tortuosity_1,
+        straight_path_fraction_0=straight_path_fraction_0,
+        straight_path_fraction_1=straight_path_fraction_1,
     )
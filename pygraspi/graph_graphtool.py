@@ -1,59 +1,212 @@
-import numpy as np
-import networkx as nx
-import doctest
-from .makeGridGraph import make_grid_graph_gt
-from graph_tool.all import *
-from graph_tool.topology import mark_subgraph
-from graph_tool.centrality import betweenness
-from graph_tool.stats import remove_labeled_edges
-
+import threading
+from collections import Counter, OrderedDict
 
-def makeImageGraph_gt(morph):
+import numpy as np
+from .makeGridGraph import (
+    ELECTRODES,
+    boundary_edges,
+    boundary_faces,
+    boundary_indices,
+    edge_lengths,
+    face_axis,
+    make_grid_edges,
+    periodic_axes,
+    tortuosity_statistics,
+    wrap_axes,
+)
+from .descriptor_plan import DescriptorPlan, describe, descriptor_names
+from .profiling import StageProfiler
+from graph_tool.all import (
+    Graph,
+    GraphView,
+    find_vertex,
+    label_components,
+    shortest_distance,
+)
+
+
+def makeImageGraph_gt(morph, periodic=False):
     """
     Construct a graph for an input image. Each pixel on the input matrix is transformed to a vertex in the graph and the connections with eight neighbors are made with edges are made with edges. Currently supports binary image matrices.
 
     Args:
         morph (ND array): The microstructure, an `(n_x, n_y, nz)`
             shaped array where `n_x, n_y and n_z` are the spatial dimensions.
+        periodic: whether the graph wraps around each axis, as in
+            `make_grid_edges`
 
     >>> data = np.array([[0,0,0],
     ...                  [1,1,1],
     ...                  [0,0,0]])
     >>> g = makeImageGraph_gt(data)
+    >>> assert(g.num_vertices() == 10)
+    >>> assert(g.num_edges() == 15)
     """
-    G = make_grid_graph_gt(morph.shape)
-    interfacev = G.add_vertex()
-
     vertex_colors = morph.flatten()
+    edges = make_grid_edges(*morph.shape, periodic=periodic)
+    interfacev = len(vertex_colors)
 
-    phase = G.new_vertex_property("int")
-    for i in range(len(vertex_colors)):
-        phase[i] = vertex_colors[i]
-    phase[int(interfacev)] = -1
-    G.vertex_properties["color"] = phase
+    G = Graph(directed=False)
+    G.add_vertex(interfacev + 1)
+    G.vertex_properties["color"] = G.new_vertex_property("int")
+    G.vertex_properties["color"].a[:-1] = vertex_colors
+    G.vertex_properties["color"].a[-1] = -1
 
-    ## Add interface vertex and change edge connections for interface vertices
-    G.set_fast_edge_removal(fast=True)
-    efilt = G.new_edge_property("int")
-    interface = []
+    ## Replace the edges across the interface with edges to the interface vertex
+    across = vertex_colors[edges[:, 0]] != vertex_colors[edges[:, 1]]
+    interface = np.unique(edges[across])
+    interface_edges = np.vstack((interface, np.full_like(interface, interfacev))).T
 
-    for e in G.edges():
-        if phase[e.source()] != phase[e.target()]:
-            efilt[e] = 1
-            interface.append([int(e.source()), int(e.target())])
-        else:
-            efilt[e] = 0
+    G.add_edge_list(np.concatenate((edges[~across], interface_edges)))
 
-    graph_tool.stats.remove_labeled_edges(G, efilt)
+    return G
 
-    interface = np.unique(np.array(interface)).flatten()
-    interface_edges = np.vstack(
-        (interface, (np.array([int(interfacev)] * interface.shape[0])))
-    ).T
 
-    G.add_edge_list(interface_edges)
+TEMPLATE_CACHE_BYTES = 2**28
 
-    return G
+_templates = threading.local()
+
+
+def make_grid_template(shape, periodic=False):
+    """
+    Construct a graph with every edge a microstructure of a given shape
+    can use.
+
+    The vertices are the pixels, the interface vertex and then a vertex
+    for each face from `boundary_faces`. The edges are the grid
+    edges, an edge from every pixel to the interface vertex and the
+    edges from the boundary vertices, in that order. The edge
+    property "length" is the distance between the pixel centres for
+    the grid edges and half a pixel for the edges from the boundary
+    vertices. A sample is applied to the template with
+    `apply_grid_template`.
+
+    With `periodic`, the grid edges wrap around the periodic axes as
+    in `make_grid_edges`, and the template also has the axes each of
+    them wraps around from `wrap_axes`.
+
+    Args:
+        shape: the shape of the microstructure
+        periodic: whether the grid wraps around each axis
+
+    >>> template = make_grid_template((3, 3))
+    >>> assert(template["graph"].num_vertices() == 14)
+    >>> assert(template["graph"].num_edges() == 20 + 9 + 12)
+    >>> template = make_grid_template((3, 3), periodic=True)
+    >>> assert(template["graph"].num_edges() == 36 + 9 + 12)
+    """
+    periodic = periodic_axes(periodic, shape)
+    edges = make_grid_edges(*shape, periodic=periodic)
+    boundaries = boundary_indices(shape)
+    pixels = np.arange(np.prod(shape))
+    interfacev = len(pixels)
+    all_edges = np.concatenate(
+        (
+            edges,
+            np.stack((pixels, np.full_like(pixels, interfacev)), axis=1),
+            boundary_edges(interfacev + 1, boundaries),
+        )
+    )
+
+    G = Graph(directed=False)
+    G.add_vertex(interfacev + 1 + len(boundaries))
+    G.add_edge_list(all_edges)
+    G.vertex_properties["color"] = G.new_vertex_property("int")
+    G.vertex_properties["color"].a[interfacev] = -1
+    G.vertex_properties["color"].a[interfacev + 1 :] = -2
+    G.edge_properties["image"] = G.new_edge_property("bool")
+    G.edge_properties["boundary"] = G.new_edge_property("bool")
+    G.edge_properties["length"] = G.new_edge_property("double")
+    G.edge_properties["length"].a = np.concatenate(
+        (
+            edge_lengths(edges, shape, periodic),
+            np.ones(len(pixels)),
+            np.full(len(all_edges) - len(edges) - len(pixels), 0.5),
+        )
+    )
+    return dict(
+        graph=G,
+        edges=edges,
+        boundaries=boundaries,
+        periodic=periodic,
+        wraps=wrap_axes(edges, shape, periodic),
+        nbytes=all_edges.nbytes,
+    )
+
+
+def grid_template(shape, periodic=False):
+    """
+    The grid template for a shape, and the periodic axes, from a least
+    recently used cache.
+
+    The cache is kept for each thread, as the templates are modified
+    by `apply_grid_template`. The least recently used templates are
+    dropped once the edges of the cached templates take more than
+    `TEMPLATE_CACHE_BYTES`, keeping at least the latest one.
+
+    Args:
+        shape: the shape of the microstructure
+        periodic: whether the grid wraps around each axis
+
+    >>> assert(grid_template((3, 3)) is grid_template((3, 3)))
+    >>> assert(grid_template((3, 3)) is not grid_template((3, 3), True))
+    """
+    cache = _templates.__dict__.setdefault("cache", OrderedDict())
+    key = (tuple(shape), periodic_axes(periodic, shape))
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    cache[key] = make_grid_template(shape, periodic)
+    while len(cache) > 1 and sum(x["nbytes"] for x in cache.values()) > (
+        TEMPLATE_CACHE_BYTES
+    ):
+        cache.popitem(last=False)
+    return cache[key]
+
+
+def apply_grid_template(template, morph):
+    """
+    Color a grid template with a microstructure.
+
+    Writes the colors of the microstructure to the template and
+    selects its edges with edge filters, without allocating a new
+    graph. The views are only valid until the template is applied to
+    another microstructure.
+
+    Args:
+        template: a template from `grid_template`
+        morph (ND array): The microstructure.
+
+    Returns:
+        a view of the graph from `makeImageGraph_gt` (with isolated
+        boundary vertices) and a view of the same graph with the
+        boundary vertices from `surface_shortest_distances`
+
+    >>> data = np.array([[0,0,0],
+    ...                  [1,1,1],
+    ...                  [0,0,0]])
+    >>> g, g_boundary = apply_grid_template(grid_template(data.shape), data)
+    >>> assert(g.num_edges() == 15)
+    >>> assert(g_boundary.num_edges() == 15 + 12)
+    """
+    G = template["graph"]
+    edges = template["edges"]
+    vertex_colors = morph.flatten()
+    G.vertex_properties["color"].a[: len(vertex_colors)] = vertex_colors
+
+    same = vertex_colors[edges[:, 0]] == vertex_colors[edges[:, 1]]
+    interface = np.zeros(len(vertex_colors), dtype=bool)
+    interface[edges[~same]] = True
+    image = np.concatenate((same, interface))
+
+    G.edge_properties["image"].a[: len(image)] = image
+    G.edge_properties["image"].a[len(image) :] = False
+    G.edge_properties["boundary"].a[: len(image)] = image
+    G.edge_properties["boundary"].a[len(image) :] = True
+    return (
+        GraphView(G, efilt=G.edge_properties["image"]),
+        GraphView(G, efilt=G.edge_properties["boundary"]),
+    )
 
 
 def count_of_vertices_gt(G, phase):
@@ -74,8 +227,7 @@ def count_of_vertices_gt(G, phase):
     >>> assert(count_of_vertices_gt(g, 1) == 3)
 
     """
-    phases = np.array(list(G.vertex_properties["color"]))
-    return (phases == phase).sum()
+    return (G.vertex_properties["color"].a == phase).sum()
 
 
 def makeConnectedComponents_gt(G, phase):
@@ -96,14 +248,9 @@ def makeConnectedComponents_gt(G, phase):
     >>> assert(makeConnectedComponents_gt(g, 1) == 1)
 
     """
-    interfacev = find_vertex(G, G.vertex_properties["color"], -1)
-    phases = np.array(list(G.vertex_properties["color"]))
-    if phase == 0:
-        phases = 1 - phases
-    vfilt = phases
-    vfilt[int(interfacev[0])] = 0
-    sub = GraphView(G, vfilt)
-    return len(set(label_components(sub)[0]))
+    phases = G.vertex_properties["color"].a
+    sub = GraphView(G, (phases != 1 - phase) & (phases != -1))
+    return len(label_components(sub)[1])
 
 
 def interfaceArea_gt(G):
@@ -123,14 +270,9 @@ def interfaceArea_gt(G):
 
     """
     interfacev = find_vertex(G, G.vertex_properties["color"], -1)[0]
-    phases = np.array(list(G.vertex_properties["color"]))
-    interface_1, interface_0 = 0, 0
-    for w in G.iter_out_neighbors(interfacev):
-        if phases[w] == 1:
-            interface_1 += 1
-        else:
-            interface_0 += 1
-    return interface_1 + interface_0, interface_0, interface_1
+    neighbors = G.vertex_properties["color"].a[G.get_out_neighbors(interfacev)]
+    interface_1 = int((neighbors == 1).sum())
+    return len(neighbors), len(neighbors) - interface_1, interface_1
 
 
 def shortest_distance_gt(G):
@@ -151,159 +293,322 @@ def shortest_distance_gt(G):
 
     """
     interfacev = find_vertex(G, G.vertex_properties["color"], -1)[0]
-    phases = np.array(list(G.vertex_properties["color"]))
+    phases = G.vertex_properties["color"].a
+    d = shortest_distance(G, interfacev).a
 
-    d = shortest_distance(G, interfacev)
-    dist_to_interface = sum(list(d)) / (len(list(d)) - 1)
-
-    vfilt = phases
-    sub_1 = GraphView(G, vfilt)
+    ## A path from a vertex to the interface vertex stays in its phase,
+    ## so the distances for each phase are those in the whole graph
+    return tuple(
+        int(d[x].sum()) / int(x.sum()) for x in (phases >= 0, phases == 0, phases == 1)
+    )
 
-    d = shortest_distance(sub_1, interfacev)
-    dist_to_interface_1 = sum(list(d)) / (len(list(d)) - 1)
 
-    phases = 1 - phases
-    vfilt_0 = phases
-    # vfilt_0[int(interfacev)] = 0
-    sub_0 = GraphView(G, vfilt_0)
+def surface_area(G, data_shape, phase):
+    """
+    Count the vertices of a phase on each boundary.
 
-    d = shortest_distance(sub_0, interfacev)
-    dist_to_interface_0 = sum(list(d)) / (len(list(d)) - 1)
+    Args:
+        G: The network representing the input microstructure.
+        data_shape: the shape of the microstructure
+        phase : The identifier of the phase of interest.
 
-    return dist_to_interface, dist_to_interface_0, dist_to_interface_1
+    Returns:
+        the counts on the left, right, top and bottom boundaries,
+        followed by the front and back boundaries in 3D
 
+    >>> data = np.array([[0,0,0],
+    ...                  [1,1,1],
+    ...                  [0,0,1]])
+    >>> g = makeImageGraph_gt(data)
+    >>> assert(surface_area(g, data.shape, 1) == (1, 2, 0, 1))
+    """
+    boundaries = boundary_indices(data_shape)
+    phases = G.vertex_properties["color"].a
+    names = ["left", "right", "top", "bottom", "front", "back"]
+    return tuple(
+        (phases[boundaries[x]] == phase).sum() for x in names if x in boundaries
+    )
 
-def surface_area(G, data_shape, phase):
-    rows, cols = data_shape
-    boundary_left = np.array([i for i in range(0, rows * cols, cols)])
-    boundary_right = np.array([i for i in range(cols - 1, rows * cols, cols)])
-    boundary_top = np.array([i for i in range(0, cols)])
-    boundary_bottom = np.array([i for i in range(rows * cols - cols, rows * cols)])
 
-    phases = np.array(list(G.vertex_properties["color"])[:-1])
-    if phase == 0:
-        phases = 1 - phases
+def surface_shortest_distances(G, data_shape):
+    """
+    Calculate the average distances to each boundary for both phases.
 
-    return (
-        sum(phases[boundary_left]),
-        sum(phases[boundary_right]),
-        sum(phases[boundary_top]),
-        sum(phases[boundary_bottom]),
-    )
+    The boundaries are the faces from `boundary_faces`, each joined to
+    its own boundary vertex, so each distance is found with a single
+    search from that vertex. Adds the boundary vertices to the graph
+    unless it already has them, as the graphs from
+    `apply_grid_template` do.
 
+    Args:
+        G: The network representing the input microstructure.
+        data_shape: the shape of the microstructure
 
-def surface_shortest_distances(G, data_shape):
-    rows, cols = data_shape
-    boundary_top = [i for i in range(0, cols)]
-    top = G.add_vertex()
-    boundary_bottom = [i for i in range(rows * cols - cols, rows * cols)]
-    bottom = G.add_vertex()
-    boundary_left = [i for i in range(0, rows * cols, cols)]
-    left = G.add_vertex()
-    boundary_right = [i for i in range(cols - 1, rows * cols, cols)]
-    right = G.add_vertex()
+    Returns:
+        the average distances to each face for phase 0 then phase 1,
+        in the order of `boundary_faces`
 
+    >>> data = np.array([[0,0,0],
+    ...                  [1,1,1],
+    ...                  [0,0,0]])
+    >>> g = makeImageGraph_gt(data)
+    >>> assert surface_shortest_distances(g, data.shape) == (2, 3, 2, 3, 2, 2, 2, 2)
+    >>> assert(g.num_vertices() == 14)
+    >>> g = makeImageGraph_gt(np.stack((data, data)))
+    >>> assert(len(surface_shortest_distances(g, (2, 3, 3))) == 12)
+    """
     phases = G.vertex_properties["color"]
-    phases[top] = -2
-    phases[bottom] = -2
-    phases[left] = -2
-    phases[right] = -2
+    if not (phases.a == -2).any():
+        boundaries = boundary_indices(data_shape)
+        first = G.num_vertices()
+        G.add_vertex(len(boundaries))
+        for v in range(first, first + len(boundaries)):
+            phases[v] = -2
+        G.add_edge_list(boundary_edges(first, boundaries))
+    phases = phases.a
+
+    result = ()
+    for v in np.flatnonzero(phases == -2):
+        d = shortest_distance(G, G.vertex(int(v))).a
+        result += (np.mean(d[phases == 0]), np.mean(d[phases == 1]))
+    return result
+
+
+def electrode_distance_gt(template, morph, phase, face):
+    """
+    Distance from an electrode to every vertex through one phase.
 
-    G.vertex_properties["color"] = phases
+    A single search from the boundary vertex of the face, in a view of
+    the template with only the edges within the phase and the edges
+    from that boundary vertex, weighted by the "length" property. The
+    search does not wrap around the axis of the face.
 
-    boundary_edges = np.concatenate(
-        (
-            np.array((list([int(top)] * len(boundary_top)), boundary_top)).T,
-            np.array((list([int(bottom)] * len(boundary_bottom)), boundary_bottom)).T,
-            np.array((list([int(left)] * len(boundary_left)), boundary_left)).T,
-            np.array((list([int(right)] * len(boundary_right)), boundary_right)).T,
-        ),
-        axis=0,
-    )
+    Args:
+        template: a template from `grid_template`
+        morph (ND array): The microstructure.
+        phase : The identifier of the phase of interest.
+        face: the face from `boundary_faces` used as the electrode
 
-    G.add_edge_list(boundary_edges)
-    phases = np.array(list(G.vertex_properties["color"]))
+    Returns:
+        the distances with the shape of `morph`, `np.inf` for pixels
+        that cannot be reached
 
-    dt = np.array(list(shortest_distance(G, top)))
-    vfilt_top_0 = list(np.where(phases == 0)[0])
-    vfilt_top_1 = list(np.where(phases == 1)[0])
+    >>> data = np.array([[0,0,1],
+    ...                  [1,0,1]])
+    >>> electrode_distance_gt(grid_template(data.shape), data, 0, "left").round(3)
+    array([[0.5  , 1.5  ,   inf],
+           [  inf, 1.914,   inf]])
+    """
+    G = template["graph"]
+    edges = template["edges"]
+    boundaries = template["boundaries"]
+    in_phase = morph.flatten() == phase
+    within = in_phase[edges[:, 0]] & in_phase[edges[:, 1]]
+    if template["periodic"][face_axis(face)]:
+        within &= ~template["wraps"][:, face_axis(face)]
+    efilt = np.concatenate(
+        [
+            within,
+            np.zeros(len(in_phase), dtype=bool),
+        ]
+        + [in_phase[x] & (name == face) for name, x in boundaries.items()]
+    )
+    electrode = G.vertex(len(in_phase) + 1 + list(boundaries).index(face))
+    distance = shortest_distance(
+        GraphView(G, efilt=efilt), electrode, weights=G.edge_properties["length"]
+    )
+    return distance.a[: len(in_phase)].reshape(morph.shape)
 
-    db = np.array(list(shortest_distance(G, bottom)))
-    vfilt_bottom_0 = list(np.where(phases == 0)[0])
-    vfilt_bottom_1 = list(np.where(phases == 1)[0])
 
-    dl = np.array(list(shortest_distance(G, left)))
-    vfilt_left_0 = list(np.where(phases == 0)[0])
-    vfilt_left_1 = list(np.where(phases == 1)[0])
+def tortuosity_gt(template, morph):
+    """
+    Tortuosity statistics of each phase to its electrode.
 
-    dr = np.array(list(shortest_distance(G, right)))
-    vfilt_right_0 = list(np.where(phases == 0)[0])
-    vfilt_right_1 = list(np.where(phases == 1)[0])
+    Phase 0 is collected at the first face of `ELECTRODES` and phase
+    1 at the second, with the distances from `electrode_distance_gt`.
 
-    return (
-        np.mean(dt[vfilt_top_0]),
-        np.mean(dt[vfilt_top_1]),
-        np.mean(db[vfilt_bottom_0]),
-        np.mean(db[vfilt_bottom_1]),
-        np.mean(dl[vfilt_left_0]),
-        np.mean(dl[vfilt_left_1]),
-        np.mean(dr[vfilt_right_0]),
-        np.mean(dr[vfilt_right_1]),
+    Args:
+        template: a template from `grid_template`
+        morph (ND array): The microstructure.
+
+    Returns:
+        the mean tortuosity and the fraction of straight paths from
+        `tortuosity_statistics` for phase 0 then phase 1
+
+    >>> data = np.array([[1,0,0],
+    ...                  [1,1,0],
+    ...                  [0,1,0]])
+    >>> actual = tortuosity_gt(grid_template(data.shape), data)
+    >>> np.round(actual, 3).tolist()
+    [1.0, 1.0, 1.069, 1.0]
+    """
+    return tuple(
+        x
+        for phase, face in enumerate(ELECTRODES)
+        for x in tortuosity_statistics(
+            electrode_distance_gt(template, morph, phase, face), morph, phase, face
+        )
     )
 
 
-def getGraspiDescriptors(data):
+class _DescriptorPlan(DescriptorPlan):
+    """
+    The intermediates of one sample on the cached grid template.
+
+    The template is applied on first use. The property maps read into
+    arrays are counted as "conversions" in `counts`.
+    """
+
+    def _convert(self, property_map):
+        self.counts["conversions"] += 1
+        return property_map.a
+
+    @property
+    def template(self):
+        """The grid template for the shape of the sample"""
+        return self._get(
+            "template", lambda: grid_template(self.data.shape, self.periodic)
+        )
+
+    @property
+    def boundaries(self):
+        """The pixels on each face"""
+        return self.template["boundaries"]
+
+    @property
+    def views(self):
+        """The views of the template from `apply_grid_template`"""
+        return self._get("views", lambda: apply_grid_template(self.template, self.data))
+
+    @property
+    def colors(self):
+        """The colour of every vertex of the template"""
+        return self._get(
+            "colors",
+            lambda: self._convert(self.views[0].vertex_properties["color"]),
+        )
+
+    @property
+    def interface(self):
+        """The pixels joined to the interface vertex"""
+
+        def neighbors():
+            interface = np.zeros(self.n_pixels, dtype=bool)
+            interface[self.views[0].get_out_neighbors(self.interfacev)] = True
+            return interface
+
+        return self._get("interface", neighbors)
+
+    @property
+    def interface_distance(self):
+        """The distances from the interface vertex to the pixels"""
+
+        def search():
+            g = self.views[0]
+            distance = self._traverse(shortest_distance, g, g.vertex(self.interfacev))
+            return self._convert(distance)[: self.n_pixels]
+
+        return self._get("interface_distance", search)
+
+    def boundary_distance(self, face):
+        """The distances from the boundary vertex of a face to the pixels"""
+
+        def search():
+            g_boundary = self.views[1]
+            cut = self.cut_axis(face)
+            if cut is not None:
+                keep = np.ones(self.template["graph"].num_edges(), dtype=bool)
+                keep[: len(self.template["edges"])] = ~self.template["wraps"][:, cut]
+                g_boundary = GraphView(g_boundary, efilt=keep)
+            index = list(self.boundaries).index(face)
+            source = g_boundary.vertex(self.interfacev + 1 + index)
+            distance = self._traverse(shortest_distance, g_boundary, source)
+            return self._convert(distance)[: self.n_pixels]
+
+        return self._get(("boundary", face), search)
+
+    def component_count(self, phase):
+        """The number of connected components of a phase"""
+
+        def label():
+            ## The boundary vertices are kept, as in `makeConnectedComponents_gt`
+            vfilt = (self.colors == phase) | (self.colors == -2)
+            view = GraphView(self.views[1], vfilt=vfilt)
+            return len(self._traverse(label_components, view)[1])
+
+        return self._get(("components", phase), label)
+
+    def tortuosity(self, phase):
+        """The tortuosity statistics of a phase, as in `tortuosity_gt`"""
+
+        def search():
+            face = ELECTRODES[phase]
+            distance = self._traverse(
+                electrode_distance_gt, self.template, self.data, phase, face
+            )
+            return tortuosity_statistics(distance, self.data, phase, face)
+
+        return self._get(("tortuosity", phase), search)
+
+
+def getGraspiDescriptors(
+    data, counts=None, descriptors=None, profile=None, periodic=False
+):
     """
     Calculate the graph descriptors for a segmented microstructure image.
 
     Args:
         data (ND array): The microstructure, an `(n_x, n_y, nz)`
             shaped array where `n_x, n_y and n_z` are the spatial dimensions.
+        counts: a `collections.Counter` updated with the number of
+            "traversals" of the graph and "conversions" of property maps
+            to arrays
+        descriptors: the names of the descriptors to calculate, all of
+            them by default. Only the searches that those descriptors
+            need are made.
+        profile: called with the record of the time and memory of
+            each stage, such as the template or one of the searches,
+            from a `StageProfiler`
+        periodic: whether the microstructure wraps around each axis,
+            as in `periodic_axes`, for a periodic simulation. The
+            searches from a face do not wrap around its axis.
+
+    Volumes also have the distances to the front and back faces. The
+    graph is the cached template for the shape of `data`, colored
+    with `apply_grid_template`, and each distance field is found once.
 
-    Example
+    >>> data = np.array([[0,0,0],
+    ...                  [1,1,1],
+    ...                  [0,0,0]])
+    >>> counts = Counter()
+    >>> actual = getGraspiDescriptors(data, counts=counts)
+    >>> assert(actual['phase_1_cc'] == 3)
+    >>> assert(actual['distance_to_top_1'] == 3)
+    >>> counts["traversals"], counts["conversions"]
+    (9, 6)
+
+    >>> counts = Counter()
+    >>> actual = getGraspiDescriptors(
+    ...     data, counts=counts, descriptors=["distance_to_top_1", "phase_0_count"]
+    ... )
+    >>> assert(actual == dict(phase_0_count=6, distance_to_top_1=3))
+    >>> counts["traversals"], counts["conversions"]
+    (1, 2)
+
+    >>> records = []
+    >>> actual = getGraspiDescriptors(
+    ...     data, descriptors=["phase_1_cc"], profile=records.append
+    ... )
+    >>> [x["stage"] for x in records]
+    ['template', 'views', 'colors', 'components 1']
+
+    >>> getGraspiDescriptors(data, descriptors=["phase_0_cc"], periodic=(True,))
+    {'phase_0_cc': 1}
     """
-    g = makeImageGraph_gt(data)
-    [interface_area, phase_0_interface, phase_1_interface] = interfaceArea_gt(g)
-    [
-        distance_to_interface,
-        distance_to_interface_0,
-        distance_to_interface_1,
-    ] = shortest_distance_gt(g)
-    [left_0, right_0, top_0, bottom_0] = surface_area(g, data.shape, 0)
-    [left_1, right_1, top_1, bottom_1] = surface_area(g, data.shape, 1)
-
-    [
-        dist_top_0,
-        dist_top_1,
-        dist_bottom_0,
-        dist_bottom_1,
-        dist_left_0,
-        dist_left_1,
-        dist_right_0,
-        dist_right_1,
-    ] = surface_shortest_distances(g, data.shape)
-
-    return dict(
-        phase_0_count=count_of_vertices_gt(g, 0),
-        phase_1_count=count_of_vertices_gt(g, 1),
-        phase_0_cc=makeConnectedComponents_gt(g, 0),
-        phase_1_cc=makeConnectedComponents_gt(g, 1),
-        interfacial_area=interface_area,
-        phase_0_interface=phase_0_interface,
-        phase_1_interface=phase_1_interface,
-        distance_to_interface=distance_to_interface,
-        distance_to_interface_0=distance_to_interface_0,
-        distance_to_interface_1=distance_to_interface_1,
-        top_boundary_count_0=top_0,
-        top_boundary_count_1=top_1,
-        bottom_boundary_count_0=bottom_0,
-        bottom_boundary_count_1=bottom_1,
-        distance_to_top_0=dist_top_0,
-        distance_to_top_1=dist_top_1,
-        distance_to_bottom_0=dist_bottom_0,
-        distance_to_bottom_1=dist_bottom_1,
-        distance_to_left_0=dist_left_0,
-        distance_to_left_1=dist_left_1,
-        distance_to_right_0=dist_right_0,
-        distance_to_right_1=dist_right_1,
+    plan = _DescriptorPlan(
+        data,
+        counts,
+        profile=profile and StageProfiler(profile),
+        periodic=periodic,
     )
+    return describe(plan, descriptors)
@@ -0,0 +1,490 @@
+"""Computes the GraSPI graph descriptors on a `scipy.sparse` adjacency
+matrix with the traversals of `scipy.sparse.csgraph`.
+
+The graph has the vertices and edges of the graph from
+`makeImageGraph_gt` with the boundary vertices of
+`surface_shortest_distances`, so it gives the same descriptors as
+`graph_graphtool` where graph-tool cannot be installed.
+
+`getMultiphaseDescriptors` gives the descriptors of microstructures
+with any number of phases on the same graph.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+from .array_descriptors import UNREACHABLE
+from .descriptor_plan import DescriptorPlan, describe, multiphase_columns
+from .makeGridGraph import (
+    ELECTRODES,
+    boundary_edges,
+    boundary_indices,
+    edge_lengths,
+    make_grid_edges,
+    tortuosity_statistics,
+    wrap_axes,
+)
+from .profiling import StageProfiler
+
+
+@lru_cache(maxsize=8)
+def sparse_template(shape, periodic=None):
+    """The grid edges of a shape, their lengths, the periodic axes each
+    wraps around and the pixels on each face
+
+    The templates of the most recently used shapes are cached, as they
+    are never modified.
+
+    Args:
+      shape: the shape of the microstructure, as a tuple
+      periodic: the periodic axes from `periodic_axes`, none by default
+
+    >>> template = sparse_template((3, 3))
+    >>> template["edges"].shape, template["lengths"].shape
+    ((20, 2), (20,))
+    >>> sparse_template((3, 3), (True, True))["wraps"].sum(0)
+    array([9, 9])
+    """
+    periodic = periodic or False
+    edges = make_grid_edges(*shape, periodic=periodic)
+    return dict(
+        edges=edges,
+        lengths=edge_lengths(edges, shape, periodic),
+        wraps=wrap_axes(edges, shape, periodic),
+        boundaries=boundary_indices(shape),
+    )
+
+
+def adjacency(edges, n_vertices, weights=None):
+    """The CSR adjacency matrix of undirected edges
+
+    Each edge is stored once. The traversals are made with
+    `directed=False`, which treats the matrix as symmetric.
+
+    Args:
+      edges: the vertex pairs of the edges
+      n_vertices: the number of vertices
+      weights: the weight of each edge, one by default
+
+    >>> adjacency(np.array([[0, 1], [1, 2]]), 4).toarray()
+    array([[0., 1., 0., 0.],
+           [0., 0., 1., 0.],
+           [0., 0., 0., 0.],
+           [0., 0., 0., 0.]])
+    """
+    if weights is None:
+        weights = np.ones(len(edges))
+    return coo_matrix(
+        (weights, (edges[:, 0], edges[:, 1])), shape=(n_vertices, n_vertices)
+    ).tocsr()
+
+
+def hop_distance(graph, source):
+    """The number of edges from `source` to every vertex
+
+    Args:
+      graph: an adjacency matrix from `adjacency`
+      source: the index of the source vertex
+
+    Returns:
+      integer distances, `UNREACHABLE` for the vertices that cannot
+      be reached, as with graph-tool
+
+    >>> hop_distance(adjacency(np.array([[0, 1], [1, 2]]), 4), 0)
+    array([         0,          1,          2, 2147483647])
+    """
+    distance = dijkstra(graph, directed=False, indices=source, unweighted=True)
+    return np.where(np.isinf(distance), UNREACHABLE, distance).astype(np.int64)
+
+
+class _SparsePlan(DescriptorPlan):
+    """
+    The intermediates of one sample on adjacency matrices.
+
+    The vertices are the pixels, the interface vertex and a vertex for
+    each face, numbered as in `make_grid_template`.
+    """
+
+    @property
+    def template(self):
+        """The template for the shape of the sample"""
+        return self._get(
+            "template", lambda: sparse_template(self.data.shape, self.periodic)
+        )
+
+    @property
+    def boundaries(self):
+        """The pixels on each face"""
+        return self.template["boundaries"]
+
+    @property
+    def colors(self):
+        """The colour of every vertex"""
+        return self._get(
+            "colors",
+            lambda: np.concatenate(
+                (self.data.ravel(), [-1], np.full(len(self.boundaries), -2))
+            ),
+        )
+
+    @property
+    def same(self):
+        """The grid edges within a phase"""
+
+        def compare():
+            edges = self.template["edges"]
+            return self.colors[edges[:, 0]] == self.colors[edges[:, 1]]
+
+        return self._get("same", compare)
+
+    @property
+    def interface(self):
+        """The pixels joined to the interface vertex"""
+
+        def across():
+            interface = np.zeros(self.n_pixels, dtype=bool)
+            interface[self.template["edges"][~self.same]] = True
+            return interface
+
+        return self._get("interface", across)
+
+    def graph(self, boundary=False, cut=None):
+        """The adjacency of the graph from `makeImageGraph_gt`, with the
+        edges from the boundary vertices if `boundary` and without the
+        edges wrapping around the axis `cut`"""
+
+        def build():
+            interface = np.flatnonzero(self.interface)
+            keep = self.same
+            if cut is not None:
+                keep = keep & ~self.template["wraps"][:, cut]
+            edges = [
+                self.template["edges"][keep],
+                np.stack((interface, np.full_like(interface, self.interfacev)), 1),
+            ]
+            if boundary:
+                edges.append(boundary_edges(self.interfacev + 1, self.boundaries))
+            return adjacency(np.concatenate(edges), len(self.colors))
+
+        return self._get(("graph", boundary, cut), build)
+
+    @property
+    def interface_distance(self):
+        """The distances from the interface vertex to the pixels"""
+
+        def search():
+            distance = self._traverse(hop_distance, self.graph(), self.interfacev)
+            return distance[: self.n_pixels]
+
+        return self._get("interface_distance", search)
+
+    def boundary_distance(self, face):
+        """The distances from the boundary vertex of a face to the pixels"""
+
+        def search():
+            source = self.interfacev + 1 + list(self.boundaries).index(face)
+            graph = self.graph(True, self.cut_axis(face))
+            distance = self._traverse(hop_distance, graph, source)
+            return distance[: self.n_pixels]
+
+        return self._get(("boundary", face), search)
+
+    def component_count(self, phase):
+        """The number of connected components of a phase"""
+
+        def label():
+            ## The boundary vertices are kept, as in `makeConnectedComponents_gt`
+            keep = np.flatnonzero((self.colors == phase) | (self.colors == -2))
+            graph = self.graph(True)[keep][:, keep]
+            return int(self._traverse(connected_components, graph, directed=False)[0])
+
+        return self._get(("components", phase), label)
+
+    def tortuosity(self, phase):
+        """The tortuosity statistics of a phase, as in `tortuosity_gt`
+
+        The electrode is a single vertex after the pixels, joined to
+        the pixels of the phase on its face by edges of half a pixel.
+        """
+
+        def search():
+            face = ELECTRODES[phase]
+            edges = self.template["edges"]
+            in_phase = self.mask(phase)
+            within = in_phase[edges[:, 0]] & in_phase[edges[:, 1]]
+            if self.cut_axis(face) is not None:
+                within &= ~self.template["wraps"][:, self.cut_axis(face)]
+            electrode = self.boundaries[face][in_phase[self.boundaries[face]]]
+            graph = adjacency(
+                np.concatenate(
+                    (
+                        edges[within],
+                        np.stack(
+                            (np.full_like(electrode, self.n_pixels), electrode), 1
+                        ),
+                    )
+                ),
+                self.n_pixels + 1,
+                np.concatenate(
+                    (self.template["lengths"][within], np.full(len(electrode), 0.5))
+                ),
+            )
+            distance = self._traverse(
+                dijkstra, graph, directed=False, indices=self.n_pixels
+            )
+            distance = distance[: self.n_pixels].reshape(self.data.shape)
+            return tortuosity_statistics(distance, self.data, phase, face)
+
+        return self._get(("tortuosity", phase), search)
+
+
+def getGraspiDescriptors(
+    data, counts=None, descriptors=None, profile=None, periodic=False
+):
+    """
+    Calculate the graph descriptors for a segmented microstructure image.
+
+    Gives the same descriptors as `getGraspiDescriptors` in
+    `graph_graphtool` with `scipy.sparse.csgraph` in place of
+    graph-tool.
+
+    Args:
+        data (ND array): The microstructure, an `(n_x, n_y, nz)`
+            shaped array where `n_x, n_y and n_z` are the spatial dimensions.
+        counts: a `collections.Counter` updated with the number of
+            "traversals" of the graph
+        descriptors: the names of the descriptors to calculate, all of
+            them by default. Only the searches that those descriptors
+            need are made.
+        profile: called with the record of the time and memory of
+            each stage, such as the adjacency or one of the searches,
+            from a `StageProfiler`
+        periodic: whether the microstructure wraps around each axis,
+            as in `periodic_axes`, for a periodic simulation. The
+            searches from a face do not wrap around its axis.
+
+    >>> data = np.array([[0,0,0],
+    ...                  [1,1,1],
+    ...                  [0,0,0]])
+    >>> actual = getGraspiDescriptors(data)
+    >>> len(actual)
+    26
+    >>> assert(actual['phase_1_cc'] == 3)
+    >>> assert(actual['distance_to_top_1'] == 3)
+    >>> assert(actual['interfacial_area'] == 9)
+    >>> len(getGraspiDescriptors(np.stack((data, data))))
+    30
+    >>> getGraspiDescriptors(data, descriptors=["phase_1_cc", "interfacial_area"])
+    {'phase_1_cc': 3, 'interfacial_area': 9}
+
+    The two bands of phase 0 are one across the periodic top and
+    bottom faces.
+
+    >>> getGraspiDescriptors(data, descriptors=["phase_0_cc"], periodic=(True,))
+    {'phase_0_cc': 1}
+    """
+    plan = _SparsePlan(
+        data,
+        counts,
+        profile=profile and StageProfiler(profile),
+        periodic=periodic,
+    )
+    return describe(plan, descriptors)
+
+
+class _MultiphasePlan(_SparsePlan):
+    """
+    The intermediates of a sample with any number of phases.
+
+    The values of every phase, such as the counts or the sums of the
+    distances, are found together from the index of the phase of each
+    pixel, and the components of every phase from a single labelling,
+    so that no step is repeated for each phase.
+    """
+
+    def __init__(self, data, phases, **kwargs):
+        super().__init__(data, **kwargs)
+        self.phases = tuple(phases)
+
+    @property
+    def phase_index(self):
+        """The index in `phases` of the phase of every pixel"""
+        return self._get(
+            "phase_index",
+            lambda: np.searchsorted(self.phases, self.colors[: self.n_pixels]),
+        )
+
+    def _per_phase(self, key, func):
+        """The bins of a `np.bincount` of the phases, cached as `key`"""
+        return self._get(key, lambda: np.bincount(func(), minlength=len(self.phases)))
+
+    def _sums(self, key, values):
+        """The sums of the values of the pixels of each phase"""
+
+        def add():
+            sums = np.zeros(len(self.phases), dtype=np.int64)
+            np.add.at(sums, self.phase_index, values())
+            return sums
+
+        return self._get(("sums", key), add)
+
+    def count(self, phase):
+        """The number of pixels of a phase"""
+        counts = self._per_phase("counts", lambda: self.phase_index)
+        return int(counts[self.phases.index(phase)])
+
+    def boundary_count(self, face, phase):
+        """The number of pixels of a phase on a face"""
+        counts = self._per_phase(
+            ("boundary_counts", face),
+            lambda: self.phase_index[self.boundaries[face]],
+        )
+        return int(counts[self.phases.index(phase)])
+
+    def interface_count(self, phase=None):
+        """The number of interface pixels, in a phase if given"""
+        if phase is None:
+            return int(self.interface.sum())
+        counts = self._per_phase(
+            "interface_counts", lambda: self.phase_index[self.interface]
+        )
+        return int(counts[self.phases.index(phase)])
+
+    @property
+    def contacts(self):
+        """The number of pixels of each phase next to each other phase,
+        as an `(n_phase, n_phase)` array"""
+
+        def count():
+            n_phase = len(self.phases)
+            edges = self.template["edges"][~self.same]
+            index = self.phase_index
+            ## Each pixel and the phase it touches, once
+            touching = np.unique(
+                np.concatenate(
+                    (
+                        edges[:, 0] * n_phase + index[edges[:, 1]],
+                        edges[:, 1] * n_phase + index[edges[:, 0]],
+                    )
+                )
+            )
+            pairs = index[touching // n_phase] * n_phase + touching % n_phase
+            return np.bincount(pairs, minlength=n_phase**2).reshape(n_phase, -1)
+
+        return self._get("contacts", count)
+
+    def contact_count(self, phase, other):
+        """The number of pixels of a phase next to another phase"""
+        return int(self.contacts[self.phases.index(phase), self.phases.index(other)])
+
+    def component_count(self, phase):
+        """The number of connected components of a phase
+
+        The components of all the phases are labelled at once, with a
+        boundary vertex for each face and phase joined to the pixels
+        of that phase on the face, as in `makeConnectedComponents_gt`.
+        """
+
+        def label():
+            n_phase = len(self.phases)
+            edges = [self.template["edges"][self.same]]
+            for i, pixels in enumerate(self.boundaries.values()):
+                vertices = self.n_pixels + i * n_phase + self.phase_index[pixels]
+                edges.append(np.stack((vertices, pixels), 1))
+            graph = adjacency(
+                np.concatenate(edges),
+                self.n_pixels + len(self.boundaries) * n_phase,
+            )
+            labels = self._traverse(connected_components, graph, directed=False)[1]
+            phases = np.zeros(labels.max() + 1, dtype=int)
+            phases[labels] = np.concatenate(
+                (self.phase_index, np.tile(np.arange(n_phase), len(self.boundaries)))
+            )
+            return np.bincount(phases, minlength=n_phase)
+
+        return int(self._get("components", label)[self.phases.index(phase)])
+
+    def _mean(self, key, values, phase):
+        """The mean of the values of the pixels of a phase, `np.nan`
+        without pixels"""
+        count = self.count(phase)
+        if count == 0:
+            return np.nan
+        return self._sums(key, values)[self.phases.index(phase)] / np.int64(count)
+
+    def mean_interface_distance(self, phase=None):
+        """The average distance to the interface, in a phase if given"""
+        if phase is None:
+            return super().mean_interface_distance()
+        return float(self._mean("interface", lambda: self.interface_distance, phase))
+
+    def mean_boundary_distance(self, face, phase):
+        """The average distance of a phase to a face"""
+        return self._mean(face, lambda: self.boundary_distance(face), phase)
+
+
+def getMultiphaseDescriptors(
+    data, phases=None, counts=None, descriptors=None, profile=None, periodic=False
+):
+    """
+    Calculate the graph descriptors of a microstructure with any
+    number of phases, such as a blend of a donor, an acceptor and a
+    mixed phase.
+
+    The columns are those of `multiphase_columns`, with the values of
+    `getGraspiDescriptors` for the columns of two phase
+    microstructures. Each search of the graph and the labelling of the
+    components is made once for all the phases. The mean distances of
+    a phase without pixels are `np.nan`.
+
+    Args:
+        data (ND array): The microstructure, with a non-negative
+            integer phase for each pixel.
+        phases: the phases of the columns, all those in `data` by
+            default. Give the same phases for samples that may lack
+            one of them.
+        counts: a `collections.Counter` updated with the number of
+            "traversals" of the graph
+        descriptors: the names of the descriptors to calculate, all of
+            them by default
+        profile: called with the record of the time and memory of
+            each stage from a `StageProfiler`
+        periodic: whether the microstructure wraps around each axis,
+            as in `getGraspiDescriptors`
+
+    >>> from collections import Counter
+    >>> data = np.array([[0,0,0,0],
+    ...                  [2,2,1,1],
+    ...                  [0,0,0,0]])
+    >>> counts = Counter()
+    >>> actual = getMultiphaseDescriptors(data, counts=counts)
+    >>> [actual[f"phase_{x}_cc"] for x in (0, 1, 2)]
+    [1, 4, 4]
+    >>> actual["phase_2_interface_1"], actual["phase_0_interface_2"]
+    (1, 6)
+    >>> counts["traversals"]
+    8
+
+    The two phase columns are those of `getGraspiDescriptors`.
+
+    >>> data = data % 2
+    >>> expected = getGraspiDescriptors(data)
+    >>> actual = getMultiphaseDescriptors(data)
+    >>> np.testing.assert_equal({x: actual[x] for x in expected}, expected)
+    """
+    if phases is None:
+        phases = np.unique(data)
+    phases = tuple(sorted({int(x) for x in phases}))
+    if phases[0] < 0 or not np.isin(data, phases).all():
+        raise ValueError(f"the phases of the sample are not all in {phases}")
+    plan = _MultiphasePlan(
+        data,
+        phases,
+        counts=counts,
+        profile=profile and StageProfiler(profile),
+        periodic=periodic,
+    )
+    return describe(plan, descriptors, multiphase_columns(data.shape, phases))
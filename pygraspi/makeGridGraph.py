@@ -1,8 +1,5 @@
-import networkx
-from graph_tool.all import *
 import numpy as np
 from itertools import product
-import numpy.ma as ma
 from toolz.curried import pipe, curry
 from toolz.curried import map as fmap
 
@@ -29,11 +26,242 @@ def index_vectors(nx, ny, nz):
         return index2D + tuple([x, y, 1] for x in (1, 0, -1) for y in (1, 0, -1))
 
 
-def make_ids_padded(ids):
+FACE_NAMES = (("top", "bottom"), ("left", "right"), ("front", "back"))
+
+
+def face_axis(face):
+    """
+    The axis normal to a face from `boundary_faces`.
+
+    >>> face_axis("right")
+    1
+    """
+    return [face in names for names in FACE_NAMES].index(True)
+
+
+def periodic_axes(periodic, shape):
+    """
+    Whether each axis of a shape wraps around, from a single flag for
+    every axis or a flag for each of the first axes.
+
+    An axis of one or two pixels is never periodic, as wrapping around
+    it gives no new neighbours.
+
+    >>> periodic_axes(True, (4, 4))
+    (True, True)
+    >>> periodic_axes((False, True), (4, 4, 1))
+    (False, True, False)
+    >>> periodic_axes(True, (4, 2))
+    (True, False)
+    """
+    if np.ndim(periodic) == 0:
+        periodic = (bool(periodic),) * len(shape)
+    if len(periodic) > len(shape):
+        raise ValueError(f"{len(periodic)} periodic flags for the shape {shape}")
+    periodic = tuple(periodic) + (False,) * (len(shape) - len(periodic))
+    return tuple(bool(x) and n > 2 for x, n in zip(periodic, shape))
+
+
+def boundary_faces(shape):
+    """
+    Index tuples selecting the boundary faces of an array, top and
+    bottom along the first axis, left and right along the second and
+    front and back along the third.
+
+    >>> list(boundary_faces((2, 3, 4)))
+    ['top', 'bottom', 'left', 'right', 'front', 'back']
+    >>> np.arange(6).reshape(2, 3)[boundary_faces((2, 3))["right"]]
+    array([2, 5])
+    """
+    faces = dict()
+    for axis, names in enumerate(FACE_NAMES[: len(shape)]):
+        for name, index in zip(names, (0, -1)):
+            faces[name] = (slice(None),) * axis + (index,)
+    return faces
+
+
+def boundary_indices(shape):
+    """The vertices on each face from `boundary_faces`.
+
+    Args:
+        shape: the shape of the microstructure
+
+    >>> boundary_indices((2, 3))["left"]
+    array([0, 3])
+    >>> boundary_indices((2, 2, 2))["back"]
+    array([1, 3, 5, 7])
+    """
+    ids = np.arange(np.prod(shape)).reshape(shape)
+    return {name: ids[face].ravel() for name, face in boundary_faces(shape).items()}
+
+
+def boundary_edges(first, boundaries):
+    """
+    The edges from a vertex for each face, numbered from `first`, to
+    the vertices on that face from `boundary_indices`.
+
+    >>> boundary_edges(4, boundary_indices((1, 2)))[:2]
+    array([[4, 0],
+           [4, 1]])
+    """
+    return np.concatenate(
+        [
+            np.stack((np.full_like(x, first + i), x), axis=1)
+            for i, x in enumerate(boundaries.values())
+        ]
+    )
+
+
+## The faces where phase 0 and phase 1 are collected, the anode and
+## the cathode of `notebooks/data/CombinedPSP.csv`
+ELECTRODES = ("right", "left")
+
+
+def electrode_distance(shape, face):
+    """
+    The straight line distance from the centre of each pixel to a
+    face from `boundary_faces`.
+
+    >>> electrode_distance((2, 3), "right")
+    array([[2.5, 1.5, 0.5],
+           [2.5, 1.5, 0.5]])
+    """
+    axis = face_axis(face)
+    distance = np.arange(shape[axis]) + 0.5
+    if FACE_NAMES[axis].index(face):
+        distance = distance[::-1]
+    index = (None,) * axis + (slice(None),) + (None,) * (len(shape) - axis - 1)
+    return np.broadcast_to(distance[index], shape)
+
+
+def _edge_steps(edges, shape, periodic):
+    """The steps along each axis of the edges, the shortest way around
+    the periodic axes, as an `(n_axis, n_edge)` array"""
+    position = np.array(np.unravel_index(edges, shape))
+    steps = np.abs(position[..., 0] - position[..., 1])
+    for axis, wrap in enumerate(periodic_axes(periodic, shape)):
+        if wrap:
+            steps[axis] = np.minimum(steps[axis], shape[axis] - steps[axis])
+    return steps
+
+
+def edge_lengths(edges, shape, periodic=False):
+    """
+    The distance between the centres of the pixels joined by each
+    edge, around the periodic axes for the edges that wrap around.
+
+    >>> edge_lengths(make_grid_edges(2, 2), (2, 2)).round(3)
+    array([1.   , 1.414, 1.   , 1.   , 1.   , 1.414])
+    >>> edge_lengths(np.array([[0, 2]]), (3,), periodic=True)
+    array([1.])
+    """
+    return np.sqrt((_edge_steps(edges, shape, periodic) ** 2).sum(axis=0))
+
+
+def wrap_axes(edges, shape, periodic=False):
+    """
+    The periodic axes each edge wraps around, as an `(n_edge, n_axis)`
+    boolean array.
+
+    >>> wrap_axes(make_grid_edges(3, 3, periodic=(True, False)), (3, 3), True).sum(0)
+    array([7, 0])
+    """
+    periodic = periodic_axes(periodic, shape)
+    if not any(periodic):
+        return np.zeros((len(edges), len(shape)), dtype=bool)
+    position = np.array(np.unravel_index(edges, shape))
+    return (np.abs(position[..., 0] - position[..., 1]) > 1).T & periodic
+
+
+def tortuosity_statistics(distance, morph, phase, face):
+    """
+    The mean tortuosity of the pixels of a phase connected to an
+    electrode and the fraction of those with a straight path.
+
+    The tortuosity of a pixel is its distance to the electrode through
+    the phase over its straight line distance from
+    `electrode_distance`. With `n` pixels between the electrodes, a
+    path is straight when its tortuosity is less than `1 + 1 / n`, as
+    for `CT_f_D_tort1` and `CT_f_A_tort1` in
+    `notebooks/data/CombinedPSP.csv`.
+
+    Args:
+      distance: the distance of each pixel from the electrode,
+        `np.inf` if it is not connected
+      morph (ND array): The microstructure.
+      phase: The identifier of the phase of interest.
+      face: the face from `boundary_faces` used as the electrode
+
+    Returns:
+      the mean tortuosity and the fraction of straight paths, both
+      `np.nan` when no pixel of the phase is connected
+
+    >>> data = np.array([[0, 0, 1, 1],
+    ...                  [1, 0, 1, 1]])
+    >>> distance = np.array([[0.5, 1.5, np.inf, np.inf],
+    ...                      [np.inf, 0.5 + 2**0.5, np.inf, np.inf]])
+    >>> tortuosity_statistics(distance, data, 0, "left").round(3).tolist()
+    [1.092, 0.667]
+    """
+    connected = (morph == phase) & np.isfinite(distance)
+    if not connected.any():
+        return np.array([np.nan, np.nan])
+    tortuosity = distance[connected] / electrode_distance(morph.shape, face)[connected]
+    axis = face_axis(face)
+    return np.array(
+        [tortuosity.mean(), (tortuosity < 1 + 1 / morph.shape[axis]).mean()]
+    )
+
+
+def wrap_padding(ids_padded, periodic):
+    """
+    Fill the padding of the periodic axes with the ids from the
+    opposite side, in place.
+
+    The axes are filled in turn, so the corners of the padding are
+    those of the axes that all wrap around.
+
+    >>> ids_padded = make_ids_padded(np.arange(3).reshape(3, 1, 1))
+    >>> wrap_padding(ids_padded, (True, False, False))[:, 1, 1]
+    array([2, 0, 1, 2, 0])
+    """
+    for axis, wrap in enumerate(periodic):
+        if wrap:
+            side = (slice(None),) * axis
+            ids_padded[side + (0,)] = ids_padded[side + (-2,)]
+            ids_padded[side + (-1,)] = ids_padded[side + (1,)]
+    return ids_padded
+
+
+def make_ids_padded(ids, periodic=(False, False, False)):
     nx, ny, nz = ids.shape
-    ids_padded = -np.ones((nx + 2, ny + 2, nz + 2), dtype=int)
+    ids_padded = -np.ones((nx + 2, ny + 2, nz + 2), dtype=ids.dtype)
     ids_padded[1:-1, 1:-1, 1:-1] = ids
-    return ids_padded
+    return wrap_padding(ids_padded, periodic)
+
+
+def make_slab_ids_padded(
+    nx, ny, nz, start, stop, dtype=int, periodic=(False, False, False)
+):
+    """
+    The padded ids for the slab `start:stop` along the first axis,
+    with the ids of the neighbouring slabs in the padding, wrapping
+    around the periodic axes.
+
+    >>> make_slab_ids_padded(3, 1, 1, 1, 2)[:, 1, 1]
+    array([0, 1, 2])
+    >>> make_slab_ids_padded(3, 1, 1, 0, 1, periodic=(True, False, False))[:, 1, 1]
+    array([2, 0, 1])
+    """
+    layers = np.arange(start - 1, stop + 1)
+    if periodic[0]:
+        layers %= nx
+    inside = (layers >= 0) & (layers < nx)
+    ids_padded = -np.ones((stop - start + 2, ny + 2, nz + 2), dtype=dtype)
+    ids_padded[inside, 1:-1, 1:-1] = layers[inside, None, None] * ny * nz + np.arange(
+        ny * nz, dtype=dtype
+    ).reshape(ny, nz)
+    return wrap_padding(ids_padded, (False,) + tuple(periodic[1:]))
 
 
 @curry
@@ -45,36 +273,121 @@ def make_sub_ids(ids_padded, indices):
     ][..., None]
 
 
-def make_neighbors(ids):
+def make_neighbors(ids, ids_padded=None, vectors=None):
     nx, ny, nz = ids.shape
-    ids_padded = make_ids_padded(ids)
+    if ids_padded is None:
+        ids_padded = make_ids_padded(ids)
 
     return pipe(
-        index_vectors(nx, ny, nz),
+        vectors or index_vectors(nx, ny, nz),
         fmap(make_sub_ids(ids_padded)),
         list,
         lambda x: np.concatenate(x, axis=-1).reshape(nx * ny * nz, len(x), 1),
     )
 
 
-def make_grid_edges(nx=1, ny=1, nz=1):
-    ids = np.arange(nx * ny * nz).reshape(nx, ny, nz)
-    return merge_edges(make_neighbors(ids), ids)
+def grid_dtype(shape):
+    """
+    The smallest signed integer type that holds the ids for a shape.
+
+    >>> grid_dtype((101, 101))
+    dtype('int16')
+    """
+    return np.min_scalar_type(-int(np.prod(shape)))
+
+
+def make_grid_edges(nx=1, ny=1, nz=1, dtype=int, periodic=False):
+    """
+    The edges between neighbouring pixels, with the ids of the pixels
+    stored as `dtype`, for example `np.int32` or `grid_dtype(shape)`.
+
+    With `periodic`, for every axis or for each axis as in
+    `periodic_axes`, the pixels on opposite faces of the periodic
+    axes are neighbours, as in a periodic simulation.
+
+    >>> make_grid_edges(2, 2)
+    array([[0, 2],
+           [0, 3],
+           [0, 1],
+           [1, 3],
+           [2, 3],
+           [2, 1]])
+    >>> make_grid_edges(3, periodic=True)
+    array([[0, 1],
+           [1, 2],
+           [2, 0]])
+    >>> len(make_grid_edges(4, 4)), len(make_grid_edges(4, 4, periodic=True))
+    (42, 64)
+    """
+    ids = np.arange(nx * ny * nz, dtype=dtype).reshape(nx, ny, nz)
+    ids_padded = make_ids_padded(ids, periodic_axes(periodic, (nx, ny, nz)))
+    return merge_edges(make_neighbors(ids, ids_padded), ids)
+
+
+def iter_grid_edges(nx=1, ny=1, nz=1, slab=1, dtype=int, periodic=False):
+    """
+    Generate the edges of `make_grid_edges` in blocks, one slab of
+    `slab` layers along the first axis at a time.
+
+    The transient arrays are only as large as a slab, rather than the
+    whole grid.
+
+    >>> blocks = list(iter_grid_edges(4, 3, 2, slab=3, dtype=np.int16))
+    >>> [len(x) for x in blocks]
+    [106, 22]
+    >>> assert np.array_equal(np.concatenate(blocks), make_grid_edges(4, 3, 2))
+    >>> blocks = iter_grid_edges(4, 3, 3, slab=3, periodic=True)
+    >>> assert np.array_equal(
+    ...     np.concatenate(list(blocks)), make_grid_edges(4, 3, 3, periodic=True)
+    ... )
+    """
+    vectors = index_vectors(nx, ny, nz)
+    periodic = periodic_axes(periodic, (nx, ny, nz))
+    for start in range(0, nx, slab):
+        stop = min(start + slab, nx)
+        ids = np.arange(start * ny * nz, stop * ny * nz, dtype=dtype).reshape(
+            stop - start, ny, nz
+        )
+        ids_padded = make_slab_ids_padded(
+            nx, ny, nz, start, stop, dtype=dtype, periodic=periodic
+        )
+        yield merge_edges(make_neighbors(ids, ids_padded, vectors), ids)
 
 
 def make_grid_graph(shape):
+    import networkx
+
     g = networkx.Graph()
     g.add_nodes_from(np.arange(np.prod(shape)))
     g.add_edges_from(make_grid_edges(*shape))
     return g
 
 
-def make_grid_graph_gt(shape):
+def make_grid_graph_gt(shape, slab=None, dtype=int, periodic=False):
     """
-    >>> make_grid_graph_gt([2, 2]) # doctest:+ELLIPSIS
-    <Graph object, undirected, with 4 vertices and 6 edges, at ...>
+    The grid graph for a shape. With `slab`, the edges are added in
+    blocks from `iter_grid_edges` so that the whole edge array is never
+    held in memory. With `periodic`, the graph wraps around the
+    periodic axes as in `make_grid_edges`.
+
+    The examples need graph-tool, and only run when it is installed.
+
+    >>> from importlib.util import find_spec
+    >>> if find_spec("graph_tool") is not None:
+    ...     g = make_grid_graph_gt([2, 2])
+    ...     assert (g.num_vertices(), g.num_edges()) == (4, 6)
+    ...     g = make_grid_graph_gt([4, 4, 4], slab=1, dtype=np.int32)
+    ...     assert (g.num_vertices(), g.num_edges()) == (64, 468)
+    ...     g = make_grid_graph_gt([4, 4], periodic=True)
+    ...     assert (g.num_vertices(), g.num_edges()) == (16, 64)
     """
+    from graph_tool import Graph
+
     g = Graph(directed=False)
     g.add_vertex(np.prod(shape))
-    g.add_edge_list(make_grid_edges(*shape))
+    if slab is None:
+        g.add_edge_list(make_grid_edges(*shape, dtype=dtype, periodic=periodic))
+    else:
+        for edges in iter_grid_edges(*shape, slab=slab, dtype=dtype, periodic=periodic):
+            g.add_edge_list(edges)
     return g
@@ -0,0 +1,97 @@
+"""Records the wall time and the memory allocated by the stages of the
+descriptor calculations, such as the skeletons or the searches of the
+graph, for the `profile` option of the descriptor functions.
+"""
+
+import time
+import tracemalloc
+
+PROFILE_COLUMNS = ("sample", "stage", "seconds", "bytes")
+
+
+def stage_name(key):
+    """The name of a stage from the key of its cached intermediate
+
+    >>> stage_name(("boundary", "top"))
+    'boundary top'
+    >>> stage_name("template")
+    'template'
+    """
+    return " ".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+
+class StageProfiler:
+    """
+    Record the stages of a calculation.
+
+    Each stage is a function that is called and timed, with the peak
+    memory traced by `tracemalloc` above that at the start of the
+    stage as the allocated bytes. The memory allocated outside Python
+    and NumPy, such as by graph-tool, is not traced. A stage run
+    within another is included in the time and bytes of both.
+
+    The peak is only reset when the profiler started the tracing.
+    When the caller is already tracing, its peak is kept, and a stage
+    that stays below that peak is recorded with the memory it still
+    holds at its end.
+
+    Args:
+      callback: called with the record of each stage, a dictionary
+        with the "stage", "seconds" and "bytes"
+
+    >>> records = []
+    >>> profiler = StageProfiler(records.append)
+    >>> profiler("outer", lambda: profiler("inner", lambda: bytearray(2**20)))[:1]
+    bytearray(b'\\x00')
+    >>> [x["stage"] for x in records]
+    ['inner', 'outer']
+    >>> assert records[1]["bytes"] >= records[0]["bytes"] >= 2**20
+    >>> assert records[1]["seconds"] >= records[0]["seconds"] > 0
+
+    The peak of a caller that is tracing is left as it is.
+
+    >>> tracemalloc.start()
+    >>> records.clear()
+    >>> large = bytearray(2**22)
+    >>> del large
+    >>> kept = profiler("small", lambda: bytearray(2**10))
+    >>> assert tracemalloc.get_traced_memory()[1] >= 2**22
+    >>> assert 2**22 > records[0]["bytes"] >= 2**10
+    >>> tracemalloc.stop()
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._peaks = []
+        self._owner = False
+
+    def __call__(self, stage, func):
+        """The result of `func()`, recorded as `stage`"""
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if not self._peaks:
+            self._owner = started
+        if self._owner:
+            if self._peaks:
+                ## The peak is reset for each stage, so keep that of the outer one
+                self._peaks[-1] = max(
+                    self._peaks[-1], tracemalloc.get_traced_memory()[1]
+                )
+            tracemalloc.reset_peak()
+        self._peaks.append(0)
+        current, before = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            return func()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            if not self._owner and peak <= before:
+                ## Below the peak of the caller, which is not reset
+                peak = max(tracemalloc.get_traced_memory()[0], current)
+            if started:
+                tracemalloc.stop()
+            self.callback(dict(stage=stage, seconds=seconds, bytes=peak - current))
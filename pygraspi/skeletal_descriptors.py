@@ -2,10 +2,161 @@
 calculates skeleton-based descriptors.
 """
 
+from functools import lru_cache
+from itertools import product
+
 import numpy as np
-import networkx as nx
-from skimage.morphology import medial_axis
-import sknw
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .profiling import StageProfiler, stage_name
+
+
+@lru_cache(maxsize=None)
+def _medial_axis_table():
+    """The lookup table of `medial_axis`, which does not depend on the image
+
+    A pixel is kept if removing it changes the number of components in
+    its 3x3 neighbourhood or if the neighbourhood has fewer than three
+    pixels.
+    """
+    patterns = (np.arange(512)[:, None] & 2 ** np.arange(9)).astype(bool)
+    patterns = patterns.reshape(512, 3, 3)
+    removed = patterns.copy()
+    removed[:, 1, 1] = False
+    components = [
+        np.array([ndimage.label(x, np.ones((3, 3)))[1] for x in y])
+        for y in (patterns, removed)
+    ]
+    table = patterns[:, 1, 1] & (
+        (components[0] != components[1]) | (patterns.sum(axis=(1, 2)) < 3)
+    )
+    return np.ascontiguousarray(table, dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _skeletonize_loop():
+    """The inner loop of `skimage.morphology.medial_axis`, `None` when
+    the installed scikit-image does not have it
+
+    The loop is private to scikit-image, so it is only used when it
+    can be imported, and `medial_axis` is used otherwise.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from skimage.morphology._skeletonize import _skeletonize_loop as loop
+    except ImportError:
+        return None
+    return loop
+
+
+def corner_scores(data):
+    """The cornerness of the pixels of both phases
+
+    The cornerness is the number of pixels of the other phase, or
+    outside the image, in the 3x3 neighbourhood of a pixel. Both
+    phases are found from a single box sum over the image.
+
+    Args:
+      data: a single two phase microstructure
+
+    Returns:
+      the cornerness for phase "a", the nonzero pixels, and phase "b"
+
+    >>> corner_scores(np.array([[1, 1, 0], [1, 1, 0]]))["b"]
+    array([[9, 7, 7],
+           [9, 7, 7]])
+    """
+    mask = np.asarray(data).astype(bool)
+    box = ndimage.correlate(
+        mask.astype(np.uint8), np.ones((3, 3), dtype=np.uint8), mode="constant"
+    ).astype(int)
+    inside = np.outer(
+        *[np.minimum(np.arange(n), 1) + 1 + (np.arange(n) < n - 1) for n in mask.shape]
+    )
+    return dict(a=9 - box, b=9 - inside + box)
+
+
+def medial_axis_phase(mask, corner_score, rng=0):
+    """The medial axis and distance map of one phase
+
+    Gives the same result as `skimage.morphology.medial_axis` with the
+    same `rng`, using the table from `_medial_axis_table` and the
+    cornerness from `corner_scores`.
+
+    Args:
+      mask: boolean mask of the phase
+      corner_score: the cornerness of the phase from `corner_scores`
+      rng: the seed or generator for the order of equally ranked pixels
+
+    Returns:
+      the medial axis and the distance map of the phase
+
+    >>> mask = np.random.default_rng(0).random((20, 30)) < 0.6
+    >>> skeleton, distance = medial_axis_phase(mask, corner_scores(mask)["a"])
+    >>> from skimage.morphology import medial_axis
+    >>> expected = medial_axis(mask, return_distance=True, rng=0)
+    >>> assert (skeleton == expected[0]).all() and (distance == expected[1]).all()
+
+    Without the loop of the installed scikit-image, `medial_axis` is
+    used instead.
+
+    >>> from unittest import mock
+    >>> with mock.patch(f"{__name__}._skeletonize_loop", lambda: None):
+    ...     fallback = medial_axis_phase(mask, corner_scores(mask)["a"])
+    >>> assert (fallback[0] == skeleton).all() and (fallback[1] == distance).all()
+    """
+    loop = _skeletonize_loop()
+    distance = ndimage.distance_transform_edt(mask)
+    i, j = np.nonzero(mask)
+    tiebreaker = np.random.default_rng(rng).permutation(np.arange(len(i)))
+    order = np.lexsort((tiebreaker, corner_score[mask], distance[mask]))
+    result = np.ascontiguousarray(mask, dtype=np.uint8).copy()
+    try:
+        if loop is None:
+            raise TypeError("no medial axis loop")
+        loop(
+            result,
+            i.astype(np.intp),
+            j.astype(np.intp),
+            order.astype(np.int32),
+            _medial_axis_table(),
+        )
+    except TypeError:
+        ## The loop is missing or takes other arguments than in the
+        ## scikit-image versions of `setup.cfg`
+        # pylint: disable=import-outside-toplevel
+        from skimage.morphology import medial_axis
+
+        return medial_axis(mask, return_distance=True, rng=rng)
+    return result.astype(bool), distance
+
+
+def skeletonize_phases(data, phases="ab", rng=0):
+    """The medial axes and distance maps of both phases
+
+    Phase "a" is the nonzero pixels and phase "b" the rest. The
+    lookup table and the cornerness are shared by both phases.
+
+    Args:
+      data: a single two phase microstructure
+      phases: the phases to skeletonize
+      rng: the seed or generator for the order of equally ranked pixels
+
+    Returns:
+      a dictionary with the skeleton and distance map of each phase
+
+    >>> data = np.zeros((9, 9))
+    >>> data[3:6] = 1
+    >>> skeletons = skeletonize_phases(data)
+    >>> assert(skeletons["a"][0].sum() == 9)
+    >>> assert(skeletons["b"][0].sum() == 18)
+    """
+    mask = np.asarray(data).astype(bool)
+    scores = corner_scores(mask)
+    masks = dict(a=mask, b=~mask)
+    return {x: medial_axis_phase(masks[x], scores[x], rng=rng) for x in phases}
 
 
 def skeletonize(data):
@@ -49,7 +200,7 @@ def skeletonize(data):
     ... )
 
     """
-    return medial_axis(data, return_distance=True)
+    return skeletonize_phases(data, phases="a")["a"]
 
 
 def f_skeletal_pixels(skeleton):
@@ -65,12 +216,23 @@ def f_skeletal_pixels(skeleton):
 
 
 def getSkeletalGraph(skeleton):
+    """The sknw graph of a skeleton
+
+    Not used by the descriptors, which count the topology with
+    `skeleton_topology`. It is kept with `getEndJunction`,
+    `getBranchLen` and `number_of_cycles` as the reference that
+    `skeleton_topology` is tested against.
+    """
+    import sknw
+
     graph = sknw.build_sknw(skeleton)
     return graph
 
 
 def getEndJunction(graph):
-    """
+    """The ends and junctions of a graph from `getSkeletalGraph`, kept
+    as the reference of `skeleton_topology`
+
     >>> data = np.array([[1,1,1],\
                 [1,1,1],\
                 [1,1,1]])
@@ -78,12 +240,16 @@ def getEndJunction(graph):
     >>> graph = getSkeletalGraph(skeleton)
     >>> assert np.allclose(getEndJunction(graph), [2, 0])
     """
-    l = [graph.degree[n] for n in graph.nodes()]
-    return np.array([l.count(1), l.count(3)])
+    degree = np.fromiter(
+        (x for _, x in graph.degree()), dtype=int, count=graph.number_of_nodes()
+    )
+    return np.array([np.count_nonzero(degree == 1), np.count_nonzero(degree == 3)])
 
 
 def getBranchLen(graph):
-    """
+    """The branches and mean branch length of a graph from
+    `getSkeletalGraph`, kept as the reference of `skeleton_topology`
+
     >>> data = np.array([[1,1,1],\
                 [1,1,1],\
                 [1,1,1]])
@@ -91,12 +257,18 @@ def getBranchLen(graph):
     >>> graph = getSkeletalGraph(skeleton)
     >>> assert np.allclose(getBranchLen(graph), [1.00, 3.41])
     """
-    b_l = [graph.edges[e]["weight"] for e in graph.edges()]
-    return np.array([len(b_l), round(sum(b_l) / len(b_l), 2)])
+    weights = np.fromiter(
+        (x for *_, x in graph.edges(data="weight")),
+        dtype=float,
+        count=graph.number_of_edges(),
+    )
+    return np.array([len(weights), round(float(weights.sum()) / len(weights), 2)])
 
 
 def number_of_cycles(graph):
-    """
+    """The cycles of a graph from `getSkeletalGraph`, kept as the
+    reference of `skeleton_topology`
+
     >>> data = np.array([[1,1,1],\
                 [1,1,1],\
                 [1,1,1]])
@@ -104,6 +276,8 @@ def number_of_cycles(graph):
     >>> graph = getSkeletalGraph(skeleton)
     >>> assert np.allclose(number_of_cycles(graph), [0, 0])
     """
+    import networkx as nx
+
     cycles = 0
     for cc in sorted(nx.connected_components(graph), key=len, reverse=True):
         if len(cc) > 2:
@@ -112,41 +286,253 @@ def number_of_cycles(graph):
     return cycles
 
 
-def getSkeletalDescriptors(data):
+def _neighbor_steps(ndim):
+    """The steps to the neighbours of a pixel, in the order used by sknw"""
+    return np.array([x for x in product((-1, 0, 1), repeat=ndim) if any(x)])
+
 
-    [skeleton_a, distance_map_a] = skeletonize(data)
-    [skeleton_b, distance_map_b] = skeletonize(1 - data)
+def skeleton_topology(skeleton):
+    """The topology of a skeleton without building its graph
 
-    graph_a = getSkeletalGraph(skeleton_a)
-    graph_b = getSkeletalGraph(skeleton_b)
+    Gives the same counts as the graph from `getSkeletalGraph`. The
+    skeleton pixels with other than two neighbours, from a neighbour
+    count convolution, are grouped into nodes. The remaining pixels
+    are labelled into branches, each joining the two nodes at its ends
+    or, without any, forming a ring with a single node. As in the
+    graph, parallel branches count once with the length of the last
+    one sknw traces. The cycles of a component of the node graph
+    follow from its Euler characteristic.
+
+    Args:
+      skeleton: a boolean skeleton
+
+    Returns:
+      a dictionary with the number of "ends", "junctions" and
+      "cycles" and the "branch_lengths"
+
+    >>> data = np.array([[1,1,1],
+    ...                  [1,1,1],
+    ...                  [1,1,1]])
+    >>> skeleton = skeletonize(data)[0]
+    >>> topology = skeleton_topology(skeleton)
+    >>> graph = getSkeletalGraph(skeleton)
+    >>> assert np.allclose(
+    ...     [topology["ends"], topology["junctions"]], getEndJunction(graph)
+    ... )
+    >>> assert np.allclose(
+    ...     np.sort(topology["branch_lengths"]),
+    ...     sorted(x for *_, x in graph.edges(data="weight")),
+    ... )
+    >>> assert(topology["cycles"] == number_of_cycles(graph))
+    """
+    padded = np.pad(np.asarray(skeleton, dtype=bool), 1)
+    shape, ndim = padded.shape, padded.ndim
+    steps = _neighbor_steps(ndim)
+    offsets = steps @ np.cumprod((1,) + shape[::-1][:-1])[::-1]
+    lengths = np.linalg.norm(steps, axis=1)
+    structure = np.ones((3,) * ndim, dtype=np.uint8)
+
+    def coordinates(index):
+        return np.stack(np.unravel_index(index, shape), axis=1) - 1
+
+    count = ndimage.correlate(padded.astype(np.uint8), structure, mode="constant")
+    is_node = (padded & (count != 3)).ravel()
+    is_branch = (padded & (count == 3)).ravel()
+    node_label, n_nodes = ndimage.label(is_node.reshape(shape), structure)
+    branch_label, n_branches = ndimage.label(is_branch.reshape(shape), structure)
+    node_label, branch_label = node_label.ravel() - 1, branch_label.ravel() - 1
+
+    node_pixels = np.flatnonzero(is_node)
+    centre = np.round(
+        np.stack(
+            [
+                np.bincount(node_label[node_pixels], weights=x, minlength=n_nodes)
+                for x in coordinates(node_pixels).T
+            ],
+            axis=1,
+        )
+        / np.bincount(node_label[node_pixels], minlength=n_nodes)[:, None]
+    )
+
+    ## The length of each branch between its end pixels, then the links
+    ## from the end pixels to the centres of the nodes
+    branch_pixels = np.flatnonzero(is_branch)
+    weight = np.zeros(n_branches)
+    ends = []
+    for k, offset in enumerate(offsets):
+        neighbor = branch_pixels + offset
+        if offset > 0:
+            inside = is_branch[neighbor]
+            weight += np.bincount(
+                branch_label[branch_pixels[inside]],
+                weights=np.full(inside.sum(), lengths[k]),
+                minlength=n_branches,
+            )
+        hit = is_node[neighbor]
+        ends.append(
+            np.stack(
+                [
+                    branch_label[branch_pixels[hit]],
+                    node_label[neighbor[hit]],
+                    neighbor[hit] * len(offsets) + len(offsets) - 1 - k,
+                    branch_pixels[hit],
+                ],
+                axis=1,
+            )
+        )
+    ends = np.concatenate(ends)
+    ends = ends[np.lexsort((ends[:, 1], ends[:, 0]))]
+    weight += np.bincount(
+        ends[:, 0],
+        weights=np.linalg.norm(centre[ends[:, 1]] - coordinates(ends[:, 3]), axis=1),
+        minlength=n_branches,
+    )
 
-    [e_a, j_a] = getEndJunction(graph_a)
-    [bn_a, bl_a] = getBranchLen(graph_a)
-    [e_b, j_b] = getEndJunction(graph_b)
-    [bn_b, bl_b] = getBranchLen(graph_b)
+    ## sknw traces each branch from the first node pixel next to it in
+    ## raster order, and the graph keeps the last of parallel branches
+    pairs = ends.reshape(-1, 2, ends.shape[1])
+    branch = pairs[:, 0, 0]
+    source, target = pairs[:, 0, 1], pairs[:, 1, 1]
+    order = pairs[:, :, 2].min(axis=1)
+    last = np.lexsort((order, target, source))
+    keep = np.ones(len(last), dtype=bool)
+    keep[:-1] = (source[last][1:] != source[last][:-1]) | (
+        target[last][1:] != target[last][:-1]
+    )
+    source, target, branch = source[last][keep], target[last][keep], branch[last][keep]
 
-    dist_on_skel_a = distance_map_a * skeleton_a
-    d_a = dist_on_skel_a[skeleton_a]
-    dist_on_skel_b = distance_map_b * skeleton_b
-    d_b = dist_on_skel_b[skeleton_b]
+    ## Branches without ends are rings, each with a node of its own
+    rings = np.setdiff1d(np.arange(n_branches), pairs[:, 0, 0])
+    ring_nodes = n_nodes + np.arange(len(rings))
+    source = np.concatenate([source, ring_nodes])
+    target = np.concatenate([target, ring_nodes])
+    weights = weight[np.concatenate([branch, rings])]
+    n_nodes += len(rings)
 
+    degree = np.bincount(source, minlength=n_nodes) + np.bincount(
+        target, minlength=n_nodes
+    )
+    n_components, component = connected_components(
+        coo_matrix((np.ones(len(source)), (source, target)), shape=(n_nodes, n_nodes)),
+        directed=False,
+    )
+    vertices = np.bincount(component, minlength=n_components)
+    edges = np.bincount(component[source], minlength=n_components)
+    euler = vertices - edges
     return dict(
-        f_skeletal_pixels_a=f_skeletal_pixels(skeleton_a),
-        f_skeletal_pixels_b=f_skeletal_pixels(skeleton_b),
-        number_of_ends_a=e_a,
-        number_of_ends_b=e_b,
-        number_of_intersections_a=j_a,
-        number_of_intersections_b=j_b,
-        number_of_branches_a=bn_a,
-        number_of_branches_b=bn_b,
-        branch_length_a=bl_a,
-        branch_length_b=bl_b,
-        dist_to_interface_min_a=min(d_a),
-        dist_to_interface_min_b=min(d_b),
-        dist_to_interface_max_a=max(d_a),
-        dist_to_interface_max_b=max(d_b),
-        dist_to_interface_avg_a=round(sum(d_a) / len(d_a), 2),
-        dist_to_interface_avg_b=round(sum(d_b) / len(d_b), 2),
-        number_of_cycles_a=number_of_cycles(graph_a),
-        number_of_cycles_b=number_of_cycles(graph_b),
+        ends=np.count_nonzero(degree == 1),
+        junctions=np.count_nonzero(degree == 3),
+        branch_lengths=weights,
+        cycles=int(np.maximum(1 - euler, 0)[vertices > 2].sum()),
     )
+
+
+class _SkeletalPlan:
+    """
+    The skeletons of both phases of one sample and their topologies,
+    each computed on first use. The cornerness from `corner_scores` is
+    shared by the phases. Each of them is a stage recorded by the
+    `StageProfiler` given as `profile`.
+    """
+
+    def __init__(self, data, rng=0, profile=None):
+        self.data = data
+        self.rng = rng
+        self.profile = profile
+        self._cache = {}
+
+    def _get(self, key, func):
+        if key not in self._cache:
+            if self.profile is None:
+                self._cache[key] = func()
+            else:
+                self._cache[key] = self.profile(stage_name(key), func)
+        return self._cache[key]
+
+    def skeleton(self, phase):
+        """The skeleton and distance map of phase "a" or "b" """
+
+        def skeletonize_phase():
+            mask = np.asarray(self.data).astype(bool)
+            scores = self._get("scores", lambda: corner_scores(mask))
+            return medial_axis_phase(
+                mask if phase == "a" else ~mask, scores[phase], rng=self.rng
+            )
+
+        return self._get(("skeleton", phase), skeletonize_phase)
+
+    def topology(self, phase):
+        """The `skeleton_topology` of a phase"""
+        return self._get(
+            ("topology", phase), lambda: skeleton_topology(self.skeleton(phase)[0])
+        )
+
+    def distances(self, phase):
+        """The distance map on the skeleton of a phase"""
+        skeleton, distance_map = self.skeleton(phase)
+        return distance_map[skeleton]
+
+
+SKELETAL_DESCRIPTORS = dict(
+    f_skeletal_pixels=lambda plan, x: f_skeletal_pixels(plan.skeleton(x)[0]),
+    number_of_ends=lambda plan, x: plan.topology(x)["ends"],
+    number_of_intersections=lambda plan, x: plan.topology(x)["junctions"],
+    ## A float, as from the array of `getBranchLen`
+    number_of_branches=lambda plan, x: float(len(plan.topology(x)["branch_lengths"])),
+    branch_length=lambda plan, x: round(
+        float(plan.topology(x)["branch_lengths"].sum())
+        / len(plan.topology(x)["branch_lengths"]),
+        2,
+    ),
+    dist_to_interface_min=lambda plan, x: plan.distances(x).min(),
+    dist_to_interface_max=lambda plan, x: plan.distances(x).max(),
+    dist_to_interface_avg=lambda plan, x: round(
+        float(plan.distances(x).sum()) / plan.distances(x).size, 2
+    ),
+    number_of_cycles=lambda plan, x: plan.topology(x)["cycles"],
+)
+
+SKELETAL_COLUMNS = tuple(
+    f"{name}_{phase}" for name, phase in product(SKELETAL_DESCRIPTORS, "ab")
+)
+
+
+def getSkeletalDescriptors(data, descriptors=None, rng=0, profile=None):
+    """
+    Calculate the skeletal descriptors of both phases.
+
+    Args:
+      data: a single microstructure with only two phases
+      descriptors: the columns from `SKELETAL_COLUMNS` to calculate,
+        all of them by default. The skeleton of a phase is only
+        calculated when a column needs it.
+      rng: the seed or generator for the order of equally ranked
+        pixels in the skeletons
+      profile: called with the record of the time and memory of each
+        stage, such as the skeleton or topology of a phase, from a
+        `StageProfiler`
+
+    >>> data = np.array([[1,1,1],
+    ...                  [1,1,1],
+    ...                  [0,0,0]])
+    >>> len(getSkeletalDescriptors(data))
+    18
+    >>> actual = getSkeletalDescriptors(data, descriptors=["f_skeletal_pixels_a"])
+    >>> assert(actual == {"f_skeletal_pixels_a": 1 / 3})
+    >>> records = []
+    >>> actual = getSkeletalDescriptors(
+    ...     data, descriptors=["number_of_ends_b"], profile=records.append
+    ... )
+    >>> [x["stage"] for x in records]
+    ['scores', 'skeleton b', 'topology b']
+    """
+    names = SKELETAL_COLUMNS if descriptors is None else descriptors
+    unknown = set(names) - set(SKELETAL_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown descriptors: {sorted(unknown)}")
+    plan = _SkeletalPlan(data, rng=rng, profile=profile and StageProfiler(profile))
+    return {
+        name: SKELETAL_DESCRIPTORS[name[:-2]](plan, name[-1])
+        for name in SKELETAL_COLUMNS
+        if name in names
+    }
@@ -0,0 +1,675 @@
+"""Computes the GraSPI graph descriptors of volumes too large for one
+graph, one tile at a time.
+
+The volume is split into tiles of at most `tile` pixels along each
+axis, each read with a halo of one pixel from its neighbours. The
+components of each tile are labelled on their own and merged across
+the tile faces, and the distances are found by a search within each
+tile starting from the distances on its halo, repeated for the tiles
+next to those whose distances changed until none changes. Only a few
+tiles and the fields of the volume are in memory at once, so the
+volume can be a memory map, such as a sample of `open_stack`, and the
+fields can be kept on disk with `scratch`, from where the workers
+read their tiles.
+
+The descriptors are those of `getGraspiDescriptors` in `graph_sparse`
+for microstructures that are not periodic.
+"""
+
+import tempfile
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from itertools import combinations, product, repeat, starmap
+from typing import NamedTuple
+
+import numpy as np
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from toolz.curried import partition_all
+
+from .array_descriptors import UNREACHABLE, interface_mask, neighbor_slices
+from .combined_descriptors import _mapped_file
+from .descriptor_plan import DescriptorPlan, describe
+from .graph_sparse import adjacency, sparse_template
+from .makeGridGraph import (
+    ELECTRODES,
+    FACE_NAMES,
+    boundary_faces,
+    electrode_distance,
+    face_axis,
+)
+
+
+def tile_slices(shape, tile):
+    """The slices of each tile of a shape and of the tile with its halo
+
+    Args:
+      shape: the shape of the volume
+      tile: the largest number of pixels of a tile along each axis
+
+    >>> tiles = tile_slices((5, 4), 3)
+    >>> len(tiles)
+    4
+    >>> tiles[1]
+    ((slice(0, 3, None), slice(3, 4, None)), (slice(0, 4, None), slice(2, 4, None)))
+    """
+    return [
+        (
+            tuple(slice(x, min(x + tile, n)) for x, n in zip(starts, shape)),
+            tuple(
+                slice(max(x - 1, 0), min(x + tile + 1, n))
+                for x, n in zip(starts, shape)
+            ),
+        )
+        for starts in product(*(range(0, n, tile) for n in shape))
+    ]
+
+
+def _inner(core, halo):
+    """The slices of a tile within the tile with its halo"""
+    return tuple(slice(x.start - y.start, x.stop - y.start) for x, y in zip(core, halo))
+
+
+def _overlap(core, halo):
+    """The slices of the pixels of a tile in the halo of another tile"""
+    return tuple(
+        slice(max(x.start, y.start) - x.start, min(x.stop, y.stop) - x.start)
+        for x, y in zip(core, halo)
+    )
+
+
+class _Part(NamedTuple):
+    """A part of an array in a file from `_mapped_file`, read by the
+    worker that uses it rather than sent to it"""
+
+    source: tuple
+    index: tuple
+
+    def read(self):
+        """The part of the array"""
+        filename, offset, shape, dtype = self.source
+        mapped = np.memmap(filename, dtype=dtype, mode="r", shape=shape, offset=offset)
+        return np.asarray(mapped[self.index])
+
+
+def _run(func, *args):
+    """The result of a function, reading the arguments that are parts"""
+    return func(*(x.read() if isinstance(x, _Part) else x for x in args))
+
+
+def _face_mask(shape, halo, face):
+    """The pixels of a block of the volume on one of its faces"""
+    axis = face_axis(face)
+    position = (0, shape[axis] - 1)[FACE_NAMES[axis].index(face)]
+    on_face = np.arange(halo[axis].start, halo[axis].stop) == position
+    index = (None,) * axis + (slice(None),) + (None,) * (len(shape) - axis - 1)
+    return np.broadcast_to(on_face[index], tuple(x.stop - x.start for x in halo))
+
+
+def _hops(distance):
+    """Integer distances, `UNREACHABLE` for the pixels never reached"""
+    return np.where(np.isinf(distance), UNREACHABLE, distance).astype(np.int64)
+
+
+def _tile_interface(block, inner):
+    """The interface pixels of a tile from the tile with its halo"""
+    return interface_mask(block)[inner]
+
+
+def _tile_labels(block):
+    """The components of each phase of a tile
+
+    Returns:
+      the label of every pixel, from 1, and the phase of each label
+    """
+    labels = np.zeros(block.shape, dtype=np.int64)
+    phases = []
+    for phase in np.unique(block):
+        found, n_found = ndimage.label(block == phase, np.ones((3,) * block.ndim))
+        labels[found > 0] = found[found > 0] + len(phases)
+        phases.extend([phase] * n_found)
+    return labels, np.array(phases, dtype=block.dtype)
+
+
+def _tile_links(block, labels):
+    """The pairs of different labels of neighbouring pixels of a phase"""
+    links = [np.empty((0, 2), dtype=np.int64)]
+    for a, b in neighbor_slices(block.shape):
+        joined = (block[a] == block[b]) & (labels[a] != labels[b])
+        links.append(np.stack((labels[a][joined], labels[b][joined]), 1))
+    return np.unique(np.concatenate(links), axis=0)
+
+
+@lru_cache(maxsize=32)
+def _crossing_edges(shape, bounds):
+    """The edges of `sparse_template` between a pixel of a tile and a
+    pixel of its halo, and their ends in that order
+
+    Those of the last used tiles are cached, enough for the first, inner
+    and last tiles along each axis of a volume.
+
+    Args:
+      shape: the shape of the tile with its halo
+      bounds: the first and last pixels of the tile along each axis
+    """
+    edges = sparse_template(shape)["edges"]
+    in_tile = np.zeros(shape, dtype=bool)
+    in_tile[tuple(slice(*x) for x in bounds)] = True
+    in_tile = in_tile.ravel()[edges]
+    crossing = np.flatnonzero(in_tile[:, 0] != in_tile[:, 1])
+    return crossing, np.where(
+        in_tile[crossing, :1], edges[crossing], edges[crossing, ::-1]
+    )
+
+
+def _tile_search(  # pylint: disable=too-many-arguments,too-many-locals
+    block, seeds, known, inner, weighted=False, phase=None
+):
+    """The distances of the pixels of a tile from a search of the tile
+    with its halo, and the distances below which a pixel of the halo
+    would shorten them
+
+    The search starts from a vertex joined to each pixel by an edge as
+    long as its distance from the `seeds` or from the distances
+    `known` so far, and follows the edges within a phase, or only
+    within `phase` if given. A pixel of the halo shortens the distance
+    of a pixel of the tile joined to it when its own distance is below
+    that distance less the length of their edge, and the largest of
+    those is its limit, `-np.inf` when it is joined to none.
+
+    Args:
+      block: the tile with its halo
+      seeds: the distances of the pixels joined to the source
+      known: the distances found so far, `np.inf` where none is
+      inner: the tile within the block
+      weighted: whether the edges have the lengths of
+        `sparse_template`, rather than a length of one
+      phase: the only phase to search
+
+    >>> block = np.array([[0, 0, 0, 1]])
+    >>> seeds = np.array([[np.inf, np.inf, np.inf, 1.0]])
+    >>> known = np.array([[np.inf, np.inf, 2.0, np.inf]])
+    >>> _tile_search(block, seeds, known, (slice(None), slice(0, 3)))
+    (array([[4., 3., 2.]]), array([[-inf, -inf, -inf, -inf]]))
+    >>> _tile_search(block * 0, seeds, known, (slice(None), slice(0, 3)))[1]
+    array([[-inf, -inf, -inf,   1.]])
+    """
+    template = sparse_template(block.shape)
+    edges = template["edges"]
+    colors = block.ravel()
+    within = colors[edges[:, 0]] == colors[edges[:, 1]]
+    if phase is not None:
+        within &= colors[edges[:, 0]] == phase
+    lengths = template["lengths"] if weighted else np.ones(len(edges))
+    start = np.minimum(seeds, known).ravel()
+    sources = np.flatnonzero(np.isfinite(start))
+    graph = adjacency(
+        np.concatenate(
+            (
+                edges[within],
+                np.stack((np.full_like(sources, block.size), sources), 1),
+            )
+        ),
+        block.size + 1,
+        np.concatenate((lengths[within], start[sources])),
+    )
+    distance = dijkstra(graph, directed=False, indices=block.size)[: block.size]
+    crossing, ends = _crossing_edges(
+        block.shape, tuple((x.start, x.stop) for x in inner)
+    )
+    ends = ends[within[crossing]]
+    limits = np.full(block.size, -np.inf)
+    np.maximum.at(
+        limits, ends[:, 1], distance[ends[:, 0]] - lengths[crossing][within[crossing]]
+    )
+    return (
+        distance.reshape(block.shape)[inner],
+        limits.reshape(block.shape),
+    )
+
+
+class _TiledPlan(DescriptorPlan):
+    """
+    The intermediates of a volume computed one tile at a time.
+
+    The fields of the volume, the interface, the component labels and
+    the distances, are arrays of the shape of the volume, in memory or
+    in files of `scratch`. Every other intermediate is a sum over the
+    tiles. Each search of the volume is counted as a "traversal" and
+    each search of a tile as a "tile_search".
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self, data, tile, *, counts=None, executor=None, workers=1, scratch=None
+    ):
+        super().__init__(data, counts)
+        self.tiles = tile_slices(data.shape, tile)
+        self.executor = executor
+        self.workers = workers
+        self.scratch = scratch
+        self._files = ExitStack()
+        positions = {
+            tuple(x.start // tile for x in core): i
+            for i, (core, _) in enumerate(self.tiles)
+        }
+        ## Each neighbour of a tile, with the pixels of the tile in the
+        ## halo of the neighbour, and the pixels of the neighbour in the
+        ## halo of the tile, within the tile with its halo
+        self.neighbors = [
+            [
+                (
+                    j,
+                    _overlap(self.tiles[i][0], self.tiles[j][1]),
+                    _overlap(self.tiles[i][1], self.tiles[j][0]),
+                )
+                for j in (
+                    positions[y]
+                    for y in product(*((x - 1, x, x + 1) for x in position))
+                    if y in positions and y != position
+                )
+            ]
+            for position, i in positions.items()
+        ]
+
+    def _field(self, fill, dtype):
+        """An array of the shape of the volume, in a file of `scratch`
+        if given, which is removed by `close`"""
+        if self.scratch is None:
+            return np.full(self.data.shape, fill, dtype=dtype)
+        handle = self._files.enter_context(
+            tempfile.NamedTemporaryFile(dir=self.scratch)
+        )
+        field = np.memmap(handle.name, dtype=dtype, mode="w+", shape=self.data.shape)
+        field[...] = fill
+        return field
+
+    def close(self):
+        """Remove the files of the fields in `scratch`"""
+        self._files.close()
+
+    def _block(self, i, field=None):
+        """A tile of a field, the volume by default, with its halo"""
+        return np.asarray((self.data if field is None else field)[self.tiles[i][1]])
+
+    def _core(self, i, field=None):
+        """A tile of a field, the volume by default"""
+        return np.asarray((self.data if field is None else field)[self.tiles[i][0]])
+
+    def _part(self, i, field=None, halo=True):
+        """A tile of a field, the volume by default, with its halo unless
+        `halo` is false, as an argument of `_map`
+
+        With workers, the tiles of a field in a file, such as a field of
+        `scratch` or a volume from `open_stack`, are read by the worker
+        from the file rather than sent to it.
+        """
+        source = self.data if field is None else field
+        if self.executor is not None:
+            mapped = _mapped_file(source)
+            if mapped is not None:
+                return _Part(mapped, self.tiles[i][halo])
+        return (self._block if halo else self._core)(i, field)
+
+    def _map(self, func, args):
+        """The results of a function for the arguments of each tile
+
+        The arguments are read `workers` tiles at a time, when the
+        results of the previous tiles have been used, and those that are
+        a `_Part` are read by the worker.
+        """
+        for chunk in partition_all(2 * self.workers, args):
+            if self.executor is None:
+                yield from starmap(func, chunk)
+            else:
+                yield from self.executor.map(_run, repeat(func), *zip(*chunk))
+
+    @property
+    def interface(self):
+        """The interface pixels"""
+
+        def find():
+            interface = self._field(False, bool)
+            indices = range(len(self.tiles))
+            args = ((self._part(i), _inner(*self.tiles[i])) for i in indices)
+            for i, found in zip(indices, self._map(_tile_interface, args)):
+                interface[self.tiles[i][0]] = found
+            return interface
+
+        return self._get("interface", find)
+
+    @property
+    def labels(self):
+        """The components of every tile, numbered across the volume,
+        and the phase of each"""
+
+        def label():
+            labels = self._field(0, np.int64)
+            phases = []
+            indices = range(len(self.tiles))
+            found = self._map(
+                _tile_labels, ((self._part(i, halo=False),) for i in indices)
+            )
+            for i, (tile_labels, tile_phases) in zip(indices, found):
+                labels[self.tiles[i][0]] = np.where(
+                    tile_labels > 0, tile_labels + sum(map(len, phases)), 0
+                )
+                phases.append(tile_phases)
+            return labels, np.concatenate(phases)
+
+        return self._get("labels", label)
+
+    @property
+    def components(self):
+        """The graph of the tile components, joined across the tile
+        faces, and then to a vertex for each face of the volume"""
+
+        def merge():
+            labels, phases = self.labels
+            indices = range(len(self.tiles))
+            args = ((self._part(i), self._part(i, labels)) for i in indices)
+            edges = list(self._map(_tile_links, args))
+            for j, side in enumerate(boundary_faces(self.data.shape).values()):
+                touching = np.unique(np.asarray(labels[side]))
+                edges.append(
+                    np.stack((np.full_like(touching, len(phases) + j + 1), touching), 1)
+                )
+            size = len(phases) + len(boundary_faces(self.data.shape)) + 1
+            edges = np.concatenate(edges) - 1
+            graph = coo_matrix(
+                (np.ones(len(edges)), (edges[:, 0], edges[:, 1])),
+                shape=(size - 1, size - 1),
+            ).tocsr()
+            return graph, phases
+
+        return self._get("components", merge)
+
+    def component_count(self, phase):
+        """The number of connected components of a phase
+
+        The tile components are joined through the edges between
+        neighbouring pixels of different tiles and through the vertex
+        of each face, which is kept, as in `makeConnectedComponents_gt`.
+        """
+
+        def label():
+            graph, phases = self.components
+            keep = np.flatnonzero(
+                np.concatenate(
+                    (phases == phase, np.ones(graph.shape[0] - len(phases), dtype=bool))
+                )
+            )
+            return int(
+                self._traverse(
+                    connected_components, graph[keep][:, keep], directed=False
+                )[0]
+            )
+
+        return self._get(("component_count", phase), label)
+
+    def _search(  # pylint: disable=too-many-locals
+        self, hubs, reach, weighted=False, phase=None, length=1.0
+    ):
+        """The distances from a search of the volume, one tile at a time
+
+        The graph has the edges within a phase, or only within `phase`
+        if given, and a vertex for each of the `hubs` joined to some of
+        the pixels by edges of `length`, as the interface and boundary
+        vertices of `graph_sparse`. Each tile is searched again
+        whenever one of its neighbours finds distances of the pixels in
+        its halo shorter than its own search of them, and the tiles
+        joined to a hub whenever the distance of the hub changes, until
+        none changes.
+
+        Args:
+          hubs: the pixels joined to each hub in a tile with its halo,
+            from the index of the tile
+          reach: the distance of each hub from the source, `0` for the
+            source and `np.inf` for the others
+          weighted: whether the edges within a phase have their lengths
+          phase: the only phase to search
+          length: the length of the edges of the hubs
+        """
+
+        def args(i):
+            read[i] = step
+            joined = hubs(i)
+            seeds = np.full(joined[0].shape, np.inf)
+            for mask, value in zip(joined, reach):
+                seeds[mask] = np.minimum(seeds[mask], value + length)
+            return (
+                self._part(i),
+                seeds,
+                self._part(i, distance),
+                _inner(*self.tiles[i]),
+                weighted,
+                phase,
+            )
+
+        self.counts["traversals"] += 1
+        distance = self._field(np.inf, float)
+        ## The tiles with pixels joined to each hub, in their halo or
+        ## not, and the hubs joined through a pixel
+        touching = [[] for _ in reach]
+        links = np.full((len(reach), len(reach)), np.inf)
+        for i in range(len(self.tiles)):
+            masks = hubs(i)
+            for j, mask in enumerate(masks):
+                if mask.any():
+                    touching[j].append(i)
+            for j, k in combinations(range(len(masks)), 2):
+                if (masks[j] & masks[k])[_inner(*self.tiles[i])].any():
+                    links[j, k] = links[k, j] = 2 * length
+        ## The distances of the hubs through each other, which most
+        ## paths between the hubs take, before any tile is searched
+        reach = np.array(reach, dtype=float)
+        for _ in range(len(reach)):
+            reach = np.minimum(reach, (reach[:, None] + links).min(axis=0))
+        reach = list(reach)
+        ## The limits of the pixels of each neighbour in the halo of a
+        ## tile from the last search of the tile, by the tile and the
+        ## neighbour
+        limits = {}
+        ## A tile is searched again when a change it depends on is newer
+        ## than the distances it read, counted in steps
+        step = 0
+        read = [-1] * len(self.tiles)
+        stale = dict.fromkeys(range(len(self.tiles)), 0)
+        while stale:
+            pending = sorted(stale)
+            stale = {}
+            found = self._map(_tile_search, map(args, pending))
+            for i, (tile_distance, tile_limits) in zip(pending, found):
+                self.counts["tile_searches"] += 1
+                core, halo = self.tiles[i]
+                closer = tile_distance < distance[core]
+                distance[core] = np.where(closer, tile_distance, distance[core])
+                step += 1
+                for j, mine, theirs in self.neighbors[i]:
+                    limits[i, j] = tile_limits[theirs]
+                    if (j, i) not in limits or (
+                        closer[mine] & (tile_distance[mine] < limits[j, i])
+                    ).any():
+                        stale[j] = step
+                for j, mask in enumerate(hubs(i)):
+                    mask = mask[_inner(core, halo)]
+                    if mask.any() and tile_distance[mask].min() + length < reach[j]:
+                        step += 1
+                        reach[j] = tile_distance[mask].min() + length
+                        stale.update(dict.fromkeys(touching[j], step))
+            stale = {x: y for x, y in stale.items() if y > read[x]}
+        return distance
+
+    def _phase_sums(self, key, values=None):
+        """The sum of the values of the pixels of each phase over the
+        tiles, or their number without `values`"""
+
+        def add():
+            sums = Counter()
+            for i in range(len(self.tiles)):
+                core = self._core(i)
+                weights = np.ones(core.shape, dtype=np.int64)
+                if values is not None:
+                    weights = values(i)
+                for phase in np.unique(core):
+                    sums[phase] += int(weights[core == phase].sum())
+            return sums
+
+        return self._get(("sums", key), add)
+
+    def count(self, phase):
+        """The number of pixels of a phase"""
+        return self._phase_sums("count")[phase]
+
+    def boundary_count(self, face, phase):
+        """The number of pixels of a phase on a face"""
+        side = boundary_faces(self.data.shape)[face]
+        return int((np.asarray(self.data[side]) == phase).sum())
+
+    def interface_count(self, phase=None):
+        """The number of interface pixels, in a phase if given"""
+        sums = self._phase_sums("interface", lambda i: self._core(i, self.interface))
+        return sum(sums.values()) if phase is None else sums[phase]
+
+    @property
+    def interface_distance(self):
+        """The distances from the interface vertex to the pixels"""
+        return self._get(
+            "interface_distance",
+            lambda: self._search(lambda i: [self._block(i, self.interface)], [0]),
+        )
+
+    def mean_interface_distance(self, phase=None):
+        """The average distance to the interface, in a phase if given"""
+        sums = self._phase_sums(
+            "interface_distance",
+            lambda i: _hops(self._core(i, self.interface_distance)),
+        )
+        if phase is None:
+            return sum(sums.values()) / self.n_pixels
+        return sums[phase] / self.count(phase)
+
+    def boundary_distance(self, face):
+        """The distances from the boundary vertex of a face to the pixels
+
+        The paths may pass through the interface vertex and the vertices
+        of the other faces, as in the graph of `graph_sparse`.
+        """
+        faces = list(boundary_faces(self.data.shape))
+
+        def hubs(i):
+            return [self._block(i, self.interface)] + [
+                _face_mask(self.data.shape, self.tiles[i][1], x) for x in faces
+            ]
+
+        reach = [np.inf] + [0 if x == face else np.inf for x in faces]
+        return self._get(("boundary", face), lambda: self._search(hubs, reach))
+
+    def mean_boundary_distance(self, face, phase):
+        """The average distance of a phase to a face"""
+        if self.count(phase) == 0:
+            return np.nan
+        sums = self._phase_sums(
+            ("boundary", face),
+            lambda i: _hops(self._core(i, self.boundary_distance(face))),
+        )
+        return np.float64(sums[phase]) / self.count(phase)
+
+    def tortuosity(self, phase):
+        """The tortuosity statistics of a phase, as in `tortuosity_statistics`
+
+        The distances from the electrode are found as in `graph_sparse`,
+        and the statistics are sums over the tiles.
+        """
+
+        def search():
+            face = ELECTRODES[phase]
+            distance = self._search(
+                lambda i: [
+                    (self._block(i) == phase)
+                    & _face_mask(self.data.shape, self.tiles[i][1], face)
+                ],
+                [0],
+                weighted=True,
+                phase=phase,
+                length=0.5,
+            )
+            straight = electrode_distance(self.data.shape, face)
+            limit = 1 + 1 / self.data.shape[face_axis(face)]
+            total = np.zeros(3)
+            for i, (core, _) in enumerate(self.tiles):
+                tile_distance = self._core(i, distance)
+                connected = (self._core(i) == phase) & np.isfinite(tile_distance)
+                tortuosity = tile_distance[connected] / straight[core][connected]
+                total += (tortuosity.sum(), (tortuosity < limit).sum(), len(tortuosity))
+            if total[2] == 0:
+                return np.array([np.nan, np.nan])
+            return total[:2] / total[2]
+
+        return self._get(("tortuosity", phase), search)
+
+
+def getTiledDescriptors(  # pylint: disable=too-many-arguments
+    data, tile=64, counts=None, descriptors=None, workers=1, scratch=None
+):
+    """
+    Calculate the graph descriptors of a volume too large for one graph.
+
+    Gives the descriptors of `getGraspiDescriptors` in `graph_sparse`
+    from searches of one tile with its halo at a time, for volumes
+    that are not periodic.
+
+    Args:
+        data (ND array): The microstructure, such as a memory map of
+            a tomography volume.
+        tile: the largest number of pixels of a tile along each axis
+        counts: a `collections.Counter` updated with the number of
+            "traversals" of the volume and the "tile_searches"
+        descriptors: the names of the descriptors to calculate, all of
+            them by default. Only the searches that those descriptors
+            need are made.
+        workers: the number of processes searching the tiles
+        scratch: a directory for the files of the fields of the
+            volume, which are kept in memory by default
+
+    >>> from pygraspi.graph_sparse import getGraspiDescriptors
+    >>> from scipy import ndimage
+    >>> noise = np.random.default_rng(0).random((12, 10, 9))
+    >>> data = (ndimage.gaussian_filter(noise, 1) > 0.5).astype(int)
+    >>> counts = Counter()
+    >>> actual = getTiledDescriptors(data, tile=4, counts=counts)
+    >>> expected = getGraspiDescriptors(data)
+    >>> np.testing.assert_allclose(
+    ...     [actual[x] for x in expected], list(expected.values())
+    ... )
+    >>> counts["traversals"], counts["tile_searches"] > 9 * 36
+    (11, True)
+
+    The fields may be kept on disk while the tiles are searched in
+    parallel.
+
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     parallel = getTiledDescriptors(
+    ...         data[:, :, 0], tile=4, workers=2, scratch=tmp
+    ...     )
+    >>> expected = getGraspiDescriptors(data[:, :, 0])
+    >>> np.testing.assert_allclose(
+    ...     [parallel[x] for x in expected], list(expected.values())
+    ... )
+    """
+    executor = ProcessPoolExecutor(workers) if workers > 1 else nullcontext()
+    with executor:
+        plan = _TiledPlan(
+            data,
+            tile,
+            counts=counts,
+            executor=executor if workers > 1 else None,
+            workers=workers,
+            scratch=scratch,
+        )
+        try:
+            return describe(plan, descriptors)
+        finally:
+            plan.close()